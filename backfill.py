@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from pathlib import Path
+
+from run import Action, AwsResource, build_action, load_environ_paramaters
+from src.twitter_api import TwitterApi
+
+SHARD_PREFIX = "shard-"
+
+
+def build_token_path(queue_path: Path) -> Path:
+    return queue_path.with_name(f"{queue_path.name}.token")
+
+
+def build_lease_key(liked_user_id: str, shard_path: Path) -> str:
+    return f"lease#{liked_user_id}#{shard_path.stem}"
+
+
+def enumerate_liked_ids(api: TwitterApi, liked_user_id: str, queue_path: Path) -> int:
+    # いいねしたツイートのIDのみを全件取得し, キューファイルに書き出す
+    # 中断した場合は .token に保存した next_token から再開する
+    token_path = build_token_path(queue_path)
+    next_token = None
+    mode = "w"
+    if token_path.exists():
+        next_token = token_path.read_text(encoding="utf-8").strip()
+        mode = "a"
+    count = 0
+    with queue_path.open(mode, encoding="utf-8") as f:
+        while True:
+            print(f"start enumerate liked tweets at {next_token}")
+            ids = api.get_liked_tweets(liked_user_id, next_token, 100)
+            for data in ids.get("data", []):
+                f.write(f"{data['id']}\n")
+                count += 1
+            f.flush()
+            next_token = ids.get("meta", {}).get("next_token")
+            if not next_token:
+                break
+            token_path.write_text(next_token, encoding="utf-8")
+    # 最後まで取得できたため, 再開用のトークンは不要
+    if token_path.exists():
+        token_path.unlink()
+    return count
+
+
+def split_queue(queue_path: Path, shard_dir: Path, shard_size: int) -> list[Path]:
+    with queue_path.open("r", encoding="utf-8") as f:
+        # 順序を保ったまま重複を除外
+        tweet_ids = list(dict.fromkeys(
+            line.strip() for line in f if line.strip()))
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    result = []
+    for start in range(0, len(tweet_ids), shard_size):
+        shard_path = shard_dir / \
+            f"{SHARD_PREFIX}{str(start // shard_size).zfill(5)}.txt"
+        with shard_path.open("w", encoding="utf-8") as f:
+            f.writelines(f"{tweet_id}\n" for tweet_id in tweet_ids[start:start + shard_size])
+        result.append(shard_path)
+    return result
+
+
+def read_shard(shard_path: Path) -> list[str]:
+    with shard_path.open("r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def build_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(action: Action, aws_resource: AwsResource, liked_user_id: str,
+               shard_dir: Path, owner: str, lease_seconds: int = 3600) -> int:
+    # リースを取得できたシャードのみ処理する. 処理したシャード数を返す
+    api = None
+    processed = 0
+    for shard_path in sorted(shard_dir.glob(f"{SHARD_PREFIX}*.txt")):
+        key = build_lease_key(liked_user_id, shard_path)
+        if not aws_resource.claim_lease(key, owner, lease_seconds):
+            continue
+        if api is None:
+            api = action.build_api()
+        print(f"[{owner}] start shard {shard_path.name}")
+        renew_at = time.monotonic() + lease_seconds / 2
+        is_lost = False
+        for tweet_id in read_shard(shard_path):
+            # リースの期限が半分を過ぎたら延長する
+            if time.monotonic() > renew_at:
+                if not aws_resource.claim_lease(key, owner, lease_seconds):
+                    is_lost = True
+                    break
+                renew_at = time.monotonic() + lease_seconds / 2
+            action.process_tweet(api, tweet_id)
+        if is_lost:
+            print(f"[{owner}] lost lease of shard {shard_path.name}")
+            continue
+        aws_resource.complete_lease(key, owner)
+        print(f"[{owner}] end shard {shard_path.name}")
+        processed += 1
+    return processed
+
+
+def worker_main(shard_dir: Path, lease_seconds: int) -> None:
+    # boto3 のセッションはプロセス間で共有できないため, プロセス毎に構築する
+    param = load_environ_paramaters()
+    action = build_action(param)
+    try:
+        run_worker(action, action.aws_resource, param.LIKED_USER_ID,
+                   shard_dir, build_owner(), lease_seconds)
+    finally:
+        action.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="いいねしたツイートを並列にバックフィルする")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enumerate_parser = sub.add_parser(
+        "enumerate", help="いいねしたツイートのIDをキューファイルに書き出す")
+    enumerate_parser.add_argument("--queue", type=Path, required=True)
+    split_parser = sub.add_parser("split", help="キューファイルをシャードに分割する")
+    split_parser.add_argument("--queue", type=Path, required=True)
+    split_parser.add_argument("--shard-dir", type=Path, required=True)
+    split_parser.add_argument("--shard-size", type=int, default=500)
+    work_parser = sub.add_parser("work", help="シャードを取得・保存する")
+    work_parser.add_argument("--shard-dir", type=Path, required=True)
+    work_parser.add_argument("--workers", type=int, default=1)
+    work_parser.add_argument("--lease-seconds", type=int, default=3600)
+    args = parser.parse_args()
+
+    if args.command == "enumerate":
+        param = load_environ_paramaters()
+        action = Action(
+            env_param=param,
+            output_dir=Path(param.OUTPUT_DIR),
+        )
+        count = enumerate_liked_ids(
+            action.build_api(), param.LIKED_USER_ID, args.queue)
+        print(f"enumerated {count} liked tweets -> {args.queue}")
+    elif args.command == "split":
+        shards = split_queue(args.queue, args.shard_dir, args.shard_size)
+        print(f"split into {len(shards)} shards -> {args.shard_dir}")
+    elif args.command == "work":
+        ctx = multiprocessing.get_context("spawn")
+        processes = [
+            ctx.Process(target=worker_main, args=(
+                args.shard_dir, args.lease_seconds))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
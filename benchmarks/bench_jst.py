@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from run import now_isof, twitter_to_jst_timezone  # noqa: E402
+
+TIMESTRS = [
+    f"Sat Feb {str(day).zfill(2)} 11:11:44 +0000 2022" for day in range(1, 29)]
+
+
+def legacy_twitter_to_jst_timezone(timestr: str) -> datetime.datetime:
+    # 比較用: 変更前の実装(strptime + 呼び出し毎の timezone 生成)
+    tt = datetime.datetime.strptime(timestr, "%a %b %d %H:%M:%S +0000 %Y")
+    jst_delta = datetime.timedelta(hours=9)
+    jst_zone = datetime.timezone(jst_delta)
+    tt += jst_delta
+    return tt.astimezone(jst_zone)
+
+
+def legacy_now_isof() -> str:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    jst_zone = datetime.timezone(datetime.timedelta(hours=9))
+    return now.astimezone(jst_zone).isoformat()
+
+
+def parse_all(func) -> None:
+    for timestr in TIMESTRS:
+        func(timestr)
+
+
+def bench(stmt, number: int) -> float:
+    # 1回あたりの時間(マイクロ秒). 5回計測した最小値を使う
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JST 変換のマイクロベンチマーク")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = [
+        ("twitter_to_jst_timezone (legacy)", bench(
+            lambda: parse_all(legacy_twitter_to_jst_timezone), args.number) / len(TIMESTRS)),
+        ("twitter_to_jst_timezone (fast parser)", bench(
+            lambda: parse_all(twitter_to_jst_timezone), args.number) / len(TIMESTRS)),
+        ("now_isof (legacy)", bench(legacy_now_isof, args.number * 10)),
+        ("now_isof", bench(now_isof, args.number * 10)),
+    ]
+    for name, usec in results:
+        print(f"{name:40s} {usec:8.3f} us/call")
+    print(f"speedup (fast parser): {results[0][1] / results[1][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
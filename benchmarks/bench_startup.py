@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# run.py を import し Action を構築するまでの時間を計測する
+# (cron 等で新着なしの場合に支払う起動コスト)
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from pathlib import Path
+from run import Action, EnvironParamaters
+param = EnvironParamaters(
+    BEARER_TOKEN="BEARER_TOKEN",
+    LIKED_USER_ID="LIKED_USER_ID",
+    PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+    PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+    OUTPUT_DIR="OUTPUT_DIR",
+    PAGETOKE_RESET=True,
+)
+Action(param, Path(param.OUTPUT_DIR))
+print(time.perf_counter() - start)
+"""
+
+# 起動時に読み込まれてはならない重いモジュール
+# src.output_sink は出力先の構築時(Action の初期化)に読み込む
+HEAVY_MODULES = ["boto3", "botocore", "requests", "src.output_sink"]
+
+
+def measure_startup(repeat: int) -> list[float]:
+    result = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=ROOT, check=True, capture_output=True, text=True)
+        result.append(float(out.stdout.strip()))
+    return result
+
+
+def loaded_heavy_modules() -> list[str]:
+    script = "import sys, run; print(','.join(sorted(sys.modules)))"
+    out = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT, check=True, capture_output=True, text=True)
+    modules = set(out.stdout.strip().split(","))
+    return [name for name in HEAVY_MODULES if name in modules]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI の起動時間を計測する")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="中央値がこの値を超えた場合に失敗させる")
+    args = parser.parse_args()
+
+    samples = measure_startup(args.repeat)
+    median_ms = statistics.median(samples) * 1000
+    print(f"startup: median {median_ms:.1f} ms, "
+          f"min {min(samples) * 1000:.1f} ms, max {max(samples) * 1000:.1f} ms "
+          f"({args.repeat} runs)")
+    heavy = loaded_heavy_modules()
+    print(f"heavy modules loaded at import: {heavy or 'none'}")
+    if heavy:
+        sys.exit(1)
+    if args.max_ms is not None and median_ms > args.max_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
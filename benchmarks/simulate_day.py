@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from run import Action, EnvironParamaters  # noqa: E402
+from src.clock import VirtualClock  # noqa: E402
+from src.scheduler import AdaptiveInterval  # noqa: E402
+from src.twitter_api import TwitterApi  # noqa: E402
+
+DAY = 24 * 3600
+_MEDIA_ID_PATTERN = re.compile(r"/media/(\d+)")
+
+
+class RateLimit:
+    # 固定ウィンドウのレート制限. window 秒あたり limit 回まで
+    def __init__(self, clock: VirtualClock, limit: int, window: float) -> None:
+        self.clock = clock
+        self.limit = limit
+        self.window = window
+        self.reset_at = 0.0
+        self.remaining = limit
+        self.rejected = 0
+
+    def take(self) -> bool:
+        now = self.clock.now()
+        if now >= self.reset_at:
+            self.reset_at = now + self.window
+            self.remaining = self.limit
+        if self.remaining <= 0:
+            self.rejected += 1
+            return False
+        self.remaining -= 1
+        return True
+
+
+class SimulatedTwitter:
+    # いいねが時間とともに増えていく Twitter API と画像 CDN の模擬
+    # 各リクエストは latency 秒の応答時間だけ仮想時刻を進める
+
+    def __init__(self, clock: VirtualClock, seed: int, backlog: int, likes_per_day: int,
+                 show_limit: int, liked_limit: int, cdn_limit: int) -> None:
+        self.clock = clock
+        rand = random.Random(seed)
+        # (いいねした時刻, ツイートID). 既存のいいねは時刻 0 以前
+        times = [-1.0] * backlog + \
+            sorted(rand.uniform(0, DAY) for _ in range(likes_per_day))
+        self.likes = [(liked_at, str(1000000 + i))
+                      for i, liked_at in enumerate(times)]
+        self.liked_at = {id: liked_at for liked_at, id in self.likes}
+        self.with_media = {id for _, id in self.likes if rand.random() < 0.7}
+        self.deleted = {id for _, id in self.likes if rand.random() < 0.02}
+        self.show_limit = RateLimit(clock, show_limit, 900)
+        self.liked_limit = RateLimit(clock, liked_limit, 900)
+        self.cdn_limit = RateLimit(clock, cdn_limit, 60)
+        self.api_calls = 0
+        self.downloads = 0
+
+    def _response(self, status: int, body: dict):
+        import requests
+        res = requests.Response()
+        res.status_code = status
+        res._content = json.dumps(body).encode()
+        return res
+
+    def get(self, url: str, params: dict):
+        self.api_calls += 1
+        self.clock.advance(0.2)
+        if url.endswith("/liked_tweets"):
+            if not self.liked_limit.take():
+                return self._response(429, {"title": "Too Many Requests"})
+            return self._response(200, self._liked_page(params.get("pagination_token"), int(params.get("max_results", 100))))
+        if not self.show_limit.take():
+            return self._response(429, {"errors": [{"code": 88}]})
+        id = params["id"]
+        if id in self.deleted:
+            return self._response(404, {"errors": [{"code": 144}]})
+        tweet = {"id_str": id, "created_at": "Wed Oct 10 20:19:24 +0000 2018", "text": f"tweet {id}",
+                 "user": {"name": "name", "screen_name": "screen_name"}, "entities": {"hashtags": []}}
+        if id in self.with_media:
+            tweet["extended_entities"] = {"media": [
+                {"type": "photo", "media_url_https": f"https://pbs.twimg.com/media/{id}.jpg"}]}
+        return self._response(200, tweet)
+
+    def _liked_page(self, token: str | None, size: int) -> dict:
+        # 新しいいいね順. pagination_token は前ページ末尾のID
+        now = self.clock.now()
+        ids = [id for liked_at, id in reversed(self.likes) if liked_at <= now]
+        start = ids.index(token) + 1 if token else 0
+        page = ids[start:start + size]
+        result = {"data": [{"id": id} for id in page],
+                  "meta": {"result_count": len(page)}}
+        if page:
+            result["meta"]["next_token"] = page[-1]
+        return result
+
+    def urlopen(self, request, timeout: float = None):
+        url = request.full_url if hasattr(request, "full_url") else request
+        self.clock.advance(0.5)
+        if not self.cdn_limit.take():
+            raise HTTPError(url, 429, "Too Many Requests", {}, io.BytesIO())
+        self.downloads += 1
+        body = b"\x89PNG" + _MEDIA_ID_PATTERN.search(url).group(1).encode()
+        res = io.BytesIO(body)
+        res.status = 200
+        res.headers = {"Content-Length": str(len(body))}
+        return res
+
+
+class MemoryAwsResource:
+    # DynamoDB・SSM の代わり
+    def __init__(self) -> None:
+        self.properties = {}
+        self.pagetoken = None
+
+    def get_value_from_ssm(self, name: str) -> str:
+        return "token"
+
+    def has_property_item(self, key: str) -> bool:
+        return key in self.properties
+
+    def put_property(self, item: dict) -> None:
+        self.properties[item["partition_key"]] = item
+
+    def get_pagetoken(self) -> str | None:
+        return self.pagetoken
+
+    def put_pagetoken(self, pagetoken: str) -> None:
+        self.pagetoken = pagetoken
+
+
+class MemorySink:
+    # 保存した時刻から, いいねしてから保存されるまでの遅れを記録する
+    def __init__(self, clock: VirtualClock, twitter: SimulatedTwitter) -> None:
+        self.clock = clock
+        self.twitter = twitter
+        self.delays = []
+
+    def write(self, created_at, id: str, index: int, data: bytes, suffix: str = ".png") -> dict:
+        liked_at = self.twitter.liked_at[id]
+        if liked_at >= 0:
+            self.delays.append(self.clock.now() - liked_at)
+        return {}
+
+
+class SimulatedAction(Action):
+    # 1日分の仮想時刻が経過したら停止する
+
+    def __init__(self, *args, api: TwitterApi, duration: float, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._sim_api = api
+        self._duration = duration
+
+    def build_api(self, http_session=None) -> TwitterApi:
+        return self._sim_api
+
+    def __call__(self) -> bool:
+        if self._clock.now() >= self._duration:
+            self.stop()
+            return False
+        return super().__call__()
+
+
+class SimulatedTwitterApi(TwitterApi):
+    def __init__(self, twitter: SimulatedTwitter, clock: VirtualClock) -> None:
+        super().__init__("token", clock=clock)
+        self.twitter = twitter
+
+    def _requests_get(self, url: str, params: dict, timeout: int = 10) -> dict:
+        return self._responce(self.twitter.get(url, params), params)
+
+
+POLICIES = {
+    # 名前: (最短間隔, 最長間隔, ダウンロード毎の待ち)
+    "fixed-60s": (60, 60, 3.0),
+    "fixed-300s": (300, 300, 3.0),
+    "adaptive-300-3600s": (300, 3600, 3.0),
+    "adaptive-300-3600s-1s": (300, 3600, 1.0),
+    "fixed-900s-0s": (900, 900, 0.0),
+}
+
+
+def simulate(name: str, args: argparse.Namespace) -> dict:
+    base, max_interval, download_interval = POLICIES[name]
+    clock = VirtualClock()
+    twitter = SimulatedTwitter(clock, args.seed, args.backlog, args.likes_per_day,
+                               args.show_limit, args.liked_limit, args.cdn_limit)
+    started_at = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN", LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME", PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR=tmp_dir, PAGETOKE_RESET=True, DOWNLOAD_INTERVAL=download_interval)
+        action = SimulatedAction(env_param, Path(tmp_dir), clock=clock, duration=args.days * DAY,
+                                 api=SimulatedTwitterApi(twitter, clock))
+        action._aws_resource = MemoryAwsResource()
+        sink = MemorySink(clock, twitter)
+        action._output_sink = sink
+        interval = AdaptiveInterval(
+            base, max_interval, jitter=0.1, rand=random.Random(args.seed))
+        with mock.patch("urllib.request.urlopen", twitter.urlopen), \
+                mock.patch("signal.signal"), \
+                contextlib.redirect_stdout(io.StringIO()):
+            action.serve(interval)
+    delays = sorted(sink.delays)
+    return {
+        "policy": name,
+        "saved": len(action._aws_resource.properties),
+        "api_calls": twitter.api_calls,
+        "rate_limited": twitter.show_limit.rejected + twitter.liked_limit.rejected + twitter.cdn_limit.rejected,
+        "mean_delay": sum(delays) / len(delays) if delays else 0.0,
+        "p95_delay": delays[int(len(delays) * 0.95)] if delays else 0.0,
+        "simulated": clock.now(),
+        "real": time.monotonic() - started_at,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="仮想時刻で常駐モードの走査をシミュレーションし, スケジューリング方針毎のスループットを比較する")
+    parser.add_argument("--policy", choices=list(POLICIES), action="append")
+    parser.add_argument("--days", type=float, default=1.0)
+    parser.add_argument("--backlog", type=int, default=300,
+                        help="開始時点で保存済みでないいいね数")
+    parser.add_argument("--likes-per-day", type=int, default=300)
+    parser.add_argument("--show-limit", type=int, default=900,
+                        help="statuses/show の15分あたりの上限")
+    parser.add_argument("--liked-limit", type=int, default=75,
+                        help="liked_tweets の15分あたりの上限")
+    parser.add_argument("--cdn-limit", type=int, default=60,
+                        help="画像ダウンロードの1分あたりの上限")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'policy':<24}{'saved':>7}{'api':>8}{'429':>6}{'mean delay':>12}{'p95 delay':>11}"
+          f"{'media/h':>9}{'sim h':>7}{'real s':>8}")
+    for name in args.policy or list(POLICIES):
+        result = simulate(name, args)
+        hours = result["simulated"] / 3600
+        print(f"{result['policy']:<24}{result['saved']:>7}{result['api_calls']:>8}{result['rate_limited']:>6}"
+              f"{result['mean_delay']:>11.0f}s{result['p95_delay']:>10.0f}s"
+              f"{result['saved'] / hours:>9.1f}{hours:>7.1f}{result['real']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from src.thumbnail import ThumbnailStage
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="保存済みの画像のうち, 未生成のサムネイルを生成する")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--thumb-dir", type=Path, required=True)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--format", default="webp",
+                        help="webp, avif, jpeg, png など Pillow で保存できる形式")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    stage = ThumbnailStage(args.output_dir, args.thumb_dir, args.size, args.format,
+                           workers=args.workers, max_pending=args.workers * 2)
+    try:
+        count = stage.catch_up()
+    finally:
+        stage.close()
+    print(f"generated {count} thumbnails -> {args.thumb_dir}")
+
+
+if __name__ == "__main__":
+    main()
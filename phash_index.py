@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from src.image_hash import (HASH_KINDS, MAX_DUPLICATE_DISTANCE, HashIndex,
+                            hash_files)
+
+
+def build_index_path(output_dir: Path) -> Path:
+    return output_dir / ".phash_index.npz"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="保存した画像の知覚ハッシュのインデックス")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--index", type=Path, default=None,
+                        help="省略時は OUTPUT_DIR/.phash_index.npz")
+    parser.add_argument("--kind", choices=HASH_KINDS, default="phash")
+    sub = parser.add_subparsers(dest="command", required=True)
+    update_parser = sub.add_parser("update", help="未登録の画像をインデックスに追加する")
+    update_parser.add_argument("--batch-size", type=int, default=256)
+    update_parser.add_argument("--workers", type=int, default=4)
+    query_parser = sub.add_parser("query", help="指定した画像に近い画像を検索する")
+    query_parser.add_argument("image", type=Path)
+    query_parser.add_argument("--max-distance", type=int, default=6)
+    duplicates_parser = sub.add_parser("duplicates", help="近似重複の組を列挙する")
+    # 距離に応じて検証する組み合わせが急増するため, 指定できる範囲を制限する
+    # (乱数のハッシュ50万件で, 距離8は約25秒, 距離10は約2.5分)
+    duplicates_parser.add_argument("--max-distance", type=int, default=4,
+                                   choices=range(MAX_DUPLICATE_DISTANCE + 1),
+                                   metavar=f"0-{MAX_DUPLICATE_DISTANCE}")
+    args = parser.parse_args()
+
+    index_path = args.index or build_index_path(args.output_dir)
+    index = HashIndex.load(index_path)
+    start = time.perf_counter()
+    if args.command == "update":
+        count = index.update(args.output_dir, args.batch_size, args.workers)
+        index.save(index_path)
+        print(f"indexed {count} new images (total {len(index)})")
+    elif args.command == "query":
+        _, hashes = hash_files([args.image], workers=1)
+        if len(hashes) == 0:
+            return
+        for key, distance in index.query(int(hashes[0, HASH_KINDS.index(args.kind)]),
+                                         args.max_distance, args.kind):
+            print(f"{distance}\t{args.output_dir / key}")
+    elif args.command == "duplicates":
+        for left, right, distance in index.find_duplicates(args.max_distance, args.kind):
+            print(f"{distance}\t{args.output_dir / left}\t{args.output_dir / right}")
+    print(f"elapsed: {time.perf_counter() - start:.3f} sec")
+
+
+if __name__ == "__main__":
+    main()
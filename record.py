@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from run import (Action, download_img, download_video,
+                 extract_media_work_items, load_environ_paramaters)
+from src.replay import Recorder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="いいねしたツイートの取得時の通信を記録し, 再生テスト用の記録ファイルを作成する")
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--max-results", type=int, default=None)
+    args = parser.parse_args()
+
+    import requests
+    param = load_environ_paramaters()
+    action = Action(
+        env_param=param,
+        output_dir=Path(param.OUTPUT_DIR),
+    )
+    recorder = Recorder()
+    # DynamoDB・出力先には書き込まず, Twitter API とダウンロードの通信のみを記録する
+    api = action.build_api(recorder.session(requests.Session()))
+    next_token = None
+    with recorder.patch_urlopen():
+        for _ in range(args.pages):
+            ids = api.get_liked_tweets(
+                param.LIKED_USER_ID, next_token, args.max_results)
+            tweet_infos = [tweet_info for tweet_info in (
+                action.fetch_media_tweet(api, data["id"]) for data in ids.get("data", []))
+                if tweet_info is not None]
+            for work_item in extract_media_work_items(tweet_infos, param.INCLUDE_VIDEO):
+                if work_item.media_type == "photo":
+                    download_img(work_item.url)
+                else:
+                    download_video(work_item.url)
+            next_token = ids.get("meta", {}).get("next_token")
+            if not next_token:
+                break
+    recorder.cassette.save(args.output)
+    print(f"recorded {len(recorder.cassette)} responses -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,34 @@ from __future__ import annotations
 
 import datetime
 import os
+import signal
 import socket
+import tempfile
+import threading
 import time
 from pathlib import Path
-from typing import NamedTuple
+from typing import TYPE_CHECKING, NamedTuple
 from urllib.error import HTTPError
-from urllib.request import urlopen
-
-import boto3
 
+from src.clock import (SYSTEM_CLOCK, Clock, WaitInterrupted,
+                       sleep_unless_stopped)
+from src.negative_cache import (MEDIA_NOT_FOUND, TWEET_NOT_FOUND,
+                                NegativeCache, build_media_key,
+                                build_tweet_key)
+# make_output_path / write_img は従来どおり run からも import できるようにする
+from src.output_path import (JST, build_file_name_stem, build_output_path,
+                             make_output_path, now_isof, write_img)
+from src.range_download import IncompleteDownloadError, PartialDownload
+from src.scheduler import AdaptiveInterval
+from src.search_index import SearchIndex
+from src.secret_cache import SecretCache
+from src.thumbnail import ThumbnailStage
 from src.twitter_api import DoseNotExistException, TwitterApi
 
+if TYPE_CHECKING:
+    # boto3 の import は重いため, 実際に利用するまで遅延させる
+    import boto3
+
 
 class EnvironParamaters(NamedTuple):
     # 環境変数
@@ -22,18 +39,70 @@ class EnvironParamaters(NamedTuple):
     PAGE_TOKE_DB_NAME: str
     OUTPUT_DIR: str
     PAGETOKE_RESET: bool
+    # 空文字の場合, bearer_token はプロセス内のみキャッシュする
+    SECRET_CACHE_PATH: str = ""
+    SECRET_CACHE_TTL: int = 3600
+    # file: 1画像1ファイル, tar: 日毎のtarシャードに追記, s3: S3 に直接アップロード
+    OUTPUT_FORMAT: str = "file"
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    # True の場合, 画像に加えて動画・GIF(mp4)も取得する
+    INCLUDE_VIDEO: bool = False
+    # 404 となったツイート・メディアの記録. 空文字の場合はプロセス内のみ保持する
+    NEGATIVE_CACHE_PATH: str = ""
+    NEGATIVE_CACHE_TTL: int = 7 * 24 * 3600
+    # True の場合, 記録済みのツイート・メディアも全て再確認する
+    NEGATIVE_CACHE_REVERIFY: bool = False
+    # メディアを1件ダウンロードする毎の待ち時間(秒). Too Many Requests 対策
+    DOWNLOAD_INTERVAL: float = 3.0
 
 
 class AwsResource():
 
     def __init__(self, env_param: EnvironParamaters, session: boto3.Session = None) -> None:
         self.env_param = env_param
-        if session is None:
-            session = boto3.Session()
-        self.ssm_client = session.client("ssm")
-        dynamodb = session.resource('dynamodb')
-        self.property_table = dynamodb.Table(self.env_param.PROPERTY_DB_NAME)
-        self.pagetoken_table = dynamodb.Table(self.env_param.PAGE_TOKE_DB_NAME)
+        # セッション・クライアントの構築は初回利用時まで遅延させる
+        self._session = session
+        self._ssm_client = None
+        self._dynamodb = None
+        self._property_table = None
+        self._pagetoken_table = None
+        # 取得済みであることが分かっている partition_key
+        # 常駐モードでは走査をまたいで保持し, DynamoDB への問い合わせを省く
+        self._known_keys = set()
+
+    @property
+    def session(self) -> boto3.Session:
+        if self._session is None:
+            import boto3
+            self._session = boto3.Session()
+        return self._session
+
+    @property
+    def ssm_client(self):
+        if self._ssm_client is None:
+            self._ssm_client = self.session.client("ssm")
+        return self._ssm_client
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            self._dynamodb = self.session.resource('dynamodb')
+        return self._dynamodb
+
+    @property
+    def property_table(self):
+        if self._property_table is None:
+            self._property_table = self.dynamodb.Table(
+                self.env_param.PROPERTY_DB_NAME)
+        return self._property_table
+
+    @property
+    def pagetoken_table(self):
+        if self._pagetoken_table is None:
+            self._pagetoken_table = self.dynamodb.Table(
+                self.env_param.PAGE_TOKE_DB_NAME)
+        return self._pagetoken_table
 
     def get_value_from_ssm(self, key: str) -> str:
         value = self.ssm_client.get_parameter(
@@ -46,14 +115,79 @@ class AwsResource():
         self.property_table.put_item(
             Item=item
         )
+        self._known_keys.add(item["partition_key"])
 
     def has_property_item(self, key: str) -> bool:
+        if key in self._known_keys:
+            return True
         res = self.property_table.get_item(
             Key={
                 "partition_key": key
             }
         )
-        return bool(res.get("Item"))
+        if res.get("Item"):
+            self._known_keys.add(key)
+            return True
+        return False
+
+    def claim_lease(self, key: str, owner: str, duration: int) -> bool:
+        # 期限切れ, もしくは自身が保持しているリースのみ取得できる
+        # 完了済み(status=done)のリースは再取得しない
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        try:
+            self.property_table.put_item(
+                Item={
+                    "partition_key": key,
+                    "owner": owner,
+                    "status": "leased",
+                    "expires_at": now + duration,
+                },
+                ConditionExpression="attribute_not_exists(partition_key)"
+                " OR (#status = :leased AND (expires_at < :now OR #owner = :owner))",
+                ExpressionAttributeNames={
+                    "#status": "status",
+                    "#owner": "owner",
+                },
+                ExpressionAttributeValues={
+                    ":leased": "leased",
+                    ":now": now,
+                    ":owner": owner,
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise e
+        return True
+
+    def complete_lease(self, key: str, owner: str) -> None:
+        self.property_table.update_item(
+            Key={
+                "partition_key": key
+            },
+            UpdateExpression="SET #status = :done, write_time = :now",
+            ConditionExpression="#owner = :owner",
+            ExpressionAttributeNames={
+                "#status": "status",
+                "#owner": "owner",
+            },
+            ExpressionAttributeValues={
+                ":done": "done",
+                ":now": now_isof(),
+                ":owner": owner,
+            },
+        )
+
+    def scan_properties(self):
+        # プロパティを全件取得する(検索インデックスの再構築用)
+        kwargs = {}
+        while True:
+            res = self.property_table.scan(**kwargs)
+            yield from res.get("Items", [])
+            if "LastEvaluatedKey" not in res:
+                return
+            kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
 
     def get_pagetoken(self) -> str:
         value = self.pagetoken_table.get_item(
@@ -73,60 +207,92 @@ class AwsResource():
         )
 
 
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+_MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+
+
 def to_jst_timezone(timestr: str, format: str) -> datetime.datetime:
+    # timestr は UTC の時刻として解釈し, JST に変換する
     tt = datetime.datetime.strptime(timestr, format)
-    jst_delta = datetime.timedelta(hours=9)
-    jst_zone = datetime.timezone(jst_delta)
-    tt += jst_delta
-    return tt.astimezone(jst_zone)
+    return tt.replace(tzinfo=datetime.timezone.utc).astimezone(JST)
 
 
 def twitter_to_jst_timezone(timestr: str) -> datetime.datetime:
-    return to_jst_timezone(timestr, "%a %b %d %H:%M:%S +0000 %Y")
-
-
-def now_isof() -> str:
-    now = datetime.datetime.now(datetime.timezone.utc)
-    jst_zone = datetime.timezone(datetime.timedelta(hours=9))
-    result = now.astimezone(jst_zone).isoformat()
-    return result
-
-
-def write_img(path: Path, data: bin) -> str:
-    with path.open("wb") as f:
-        f.write(data)
-    return now_isof()
-
-
-def download_img(url: str) -> bin | None:
+    # "Sat Feb 19 11:11:44 +0000 2022" の固定長の書式は, strptime を使わず位置で切り出す
+    if len(timestr) == 30 and timestr[20:25] == "+0000":
+        try:
+            tt = datetime.datetime(
+                int(timestr[26:30]), _MONTHS[timestr[4:7]], int(timestr[8:10]),
+                int(timestr[11:13]), int(timestr[14:16]), int(timestr[17:19]),
+                tzinfo=datetime.timezone.utc)
+            return tt.astimezone(JST)
+        except (KeyError, ValueError):
+            pass
+    return to_jst_timezone(timestr, TWITTER_DATE_FORMAT)
+
+
+def download_img(url: str, partial_dir: Path | None = None, clock: Clock = SYSTEM_CLOCK,
+                 stop_event: threading.Event | None = None) -> bin | None:
+    return download(rebuild_url(url), partial_dir=partial_dir, clock=clock, stop_event=stop_event)
+
+
+def download_video(url: str, partial_dir: Path | None = None, clock: Clock = SYSTEM_CLOCK,
+                   stop_event: threading.Event | None = None) -> bin | None:
+    # 動画は大きいため, メモリ上に溜めずに partial_dir に直接書き込む
+    return download(url, partial_dir=partial_dir, clock=clock, stop_event=stop_event, stream=True)
+
+
+def download(url: str, chunk_size: int = 1024 * 1024, partial_dir: Path | None = None,
+             clock: Clock = SYSTEM_CLOCK, stop_event: threading.Event | None = None,
+             stream: bool = False) -> bin | None:
+    # 受信はメモリ上で行い, 中断した場合のみ受信済みの分を partial_dir に書き出して, リトライ時は HTTP Range で続きから取得する
+    # stream=True の場合は, 受信しながら partial_dir に書き込む
+    # partial_dir を指定しない場合, 再開できるのはこの呼び出しの中のリトライのみ
+    # stop_event が set された場合, リトライの待ちを打ち切り WaitInterrupted を送出する
+    if partial_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return download(url, chunk_size, Path(tmp_dir), clock, stop_event, stream)
+    # urllib.request の import は重いため, ダウンロード時まで遅延させる
+    from http.client import IncompleteRead
+    from urllib.request import urlopen
+    partial = PartialDownload(partial_dir, url)
     exception = None
     wait_time = 30
     for _ in range(10):
         try:
-            with urlopen(rebuild_url(url), timeout=20.0) as twitter_img:
-                return twitter_img.read()
+            with urlopen(partial.build_request(), timeout=20.0) as res:
+                return partial.receive(res, chunk_size, stream)
         except HTTPError as e:
             if e.code in [504, 500]:
                 # リトライ実施
                 exception = e
                 print(f"start retry wait {wait_time}...")
-                time.sleep(wait_time)
+                sleep_unless_stopped(clock, wait_time, stop_event)
                 wait_time *= 2
             elif e.code in [429]:
                 # 固定で300秒まつ
                 exception = e
                 print(f"start retry wait {wait_time}...")
-                time.sleep(wait_time)
+                sleep_unless_stopped(clock, wait_time, stop_event)
                 wait_time += 300
+            elif e.code == 416:
+                # 保持していた範囲が不正なため, 待たずに最初から取り直す
+                exception = e
+                partial.discard()
             elif e.code == 404:
+                partial.discard()
                 return None
             else:
                 raise e
 
-        except socket.timeout as te:
+        except (socket.timeout, IncompleteRead, IncompleteDownloadError) as te:
+            # 受信済みの分は残っているため, 次回は続きから取得する
             exception = te
-            print(f"start retry wait {wait_time}...")
-            time.sleep(wait_time)
+            print(f"start retry wait {wait_time} (received {partial.size()} bytes)...")
+            sleep_unless_stopped(clock, wait_time, stop_event)
             wait_time *= 2
     # リトライオーバー
     print("Retry Limit.")
@@ -140,134 +306,360 @@ def rebuild_url(before_url: str) -> str:
     return f"{before_url[:-4]}?format=png&name=large"
 
 
-def make_output_path(output_dir: Path, created_at: datetime.datetime, id: str, index: int) -> Path:
-    result = output_dir
-    result.mkdir(exist_ok=True)
-    result /= f"yyyy={created_at.year}"
-    result.mkdir(exist_ok=True)
-    result /= f"mm={str(created_at.month).zfill(2)}"
-    result.mkdir(exist_ok=True)
-    result /= f"dd={str(created_at.day).zfill(2)}"
-    result.mkdir(exist_ok=True)
-    result /= f"{build_file_name_stem(id, index)}.png"
-    return result
+def hashtags_to_str(hashtags: list) -> str:
+    return ",".join(hashtag["text"] for hashtag in hashtags)
 
 
-def build_file_name_stem(id: str, index: int) -> str:
-    return f"{id}_{index}"
+VIDEO_TYPES = ["video", "animated_gif"]
+
+
+class MediaWorkItem(NamedTuple):
+    # ダウンロード対象のメディア1件分
+    tweet_info: dict
+    index: int
+    media_type: str
+    url: str
+    suffix: str
+
+    @property
+    def stem(self) -> str:
+        return build_file_name_stem(self.tweet_info["id_str"], self.index)
+
+
+def best_video_url(media: dict) -> str | None:
+    # video_info の mp4 のうち, 最もビットレートが高いものを選ぶ
+    variants = [
+        variant for variant in media.get("video_info", {}).get("variants", [])
+        if variant.get("content_type") == "video/mp4"
+    ]
+    if not variants:
+        return None
+    return max(variants, key=lambda variant: variant.get("bitrate", 0))["url"]
+
+
+def extract_media_work_items(tweet_infos: list, include_video: bool = False) -> list:
+    # ツイートの一覧から, 取得対象のメディアだけを平坦なリストとして取り出す
+    # ユーザー名や日時の解析は, 実際にダウンロードするメディアがある場合のみ後で行う
+    result = []
+    for tweet_info in tweet_infos:
+        for idx, media in enumerate(tweet_info.get("extended_entities", {}).get("media", [])):
+            if media["type"] == "photo":
+                result.append(MediaWorkItem(
+                    tweet_info, idx, "photo", media["media_url_https"], ".png"))
+            elif include_video and media["type"] in VIDEO_TYPES:
+                url = best_video_url(media)
+                if url is not None:
+                    result.append(MediaWorkItem(
+                        tweet_info, idx, media["type"], url, ".mp4"))
+    return result
 
 
-def hashtags_to_str(hashtags: list) -> str:
-    return ",".join(hashtag["text"] for hashtag in hashtags)
+def build_tweet_property(tweet_info: dict) -> tuple:
+    # (投稿日時, プロパティの共通項目) を返す
+    created_at = twitter_to_jst_timezone(tweet_info["created_at"])
+    return created_at, {
+        "created_at": created_at.isoformat(),
+        "text": tweet_info["text"],
+        "user_name": tweet_info["user"]["name"],
+        "user_screen_name": tweet_info["user"]["screen_name"],
+        "hashtag": hashtags_to_str(tweet_info["entities"]["hashtags"]),
+    }
 
 
 class Action():
 
-    def __init__(self, env_param: EnvironParamaters, output_dir: Path, session: boto3.Session = None) -> None:
+    def __init__(self, env_param: EnvironParamaters, output_dir: Path, session: boto3.Session = None,
+                 thumbnail_stage: ThumbnailStage = None, search_index: SearchIndex = None,
+                 clock: Clock = SYSTEM_CLOCK) -> None:
         self._env_param = env_param
         self._output_dir = output_dir
+        # 待ち時間に使う時計. シミュレーションでは仮想時刻の時計を指定する
+        self._clock = clock
+        # 指定した場合, 保存した画像のサムネイルを生成する
+        self._thumbnail_stage = thumbnail_stage
+        # 指定した場合, 保存した画像のプロパティを検索インデックスに登録する
+        self._search_index = search_index
         self._aws_resource = AwsResource(env_param, session)
+        # 出力先の構築時のみ import する(S3 の処理を起動時に読み込まない)
+        from src.output_sink import build_output_sink
+        self._output_sink = build_output_sink(
+            env_param, output_dir, self._aws_resource)
+        # 中断したダウンロードの受信済みデータの保存先. 次回の実行でも続きから取得できるよう OUTPUT_DIR 配下に置く
+        self._partial_dir = output_dir / ".partial"
+        secret_cache_path = None
+        if env_param.SECRET_CACHE_PATH:
+            secret_cache_path = Path(env_param.SECRET_CACHE_PATH).expanduser()
+        self._secret_cache = SecretCache(
+            secret_cache_path, env_param.SECRET_CACHE_TTL)
+        negative_cache_path = None
+        if env_param.NEGATIVE_CACHE_PATH:
+            negative_cache_path = Path(
+                env_param.NEGATIVE_CACHE_PATH).expanduser()
+        self._negative_cache = NegativeCache(
+            negative_cache_path, env_param.NEGATIVE_CACHE_TTL, env_param.NEGATIVE_CACHE_REVERIFY)
+        self._api = None
+        # 常駐モードの停止要求
+        self._stop_event = threading.Event()
+        # True の場合, PAGETOKE_RESET によらず最新のいいねから走査する
+        self._scan_from_latest = False
+
+    @property
+    def aws_resource(self) -> AwsResource:
+        return self._aws_resource
+
+    def build_api(self, http_session=None) -> TwitterApi:
+        return TwitterApi(
+            bearer_token=self._get_bearer_token(),
+            on_unauthorized=lambda: self._get_bearer_token(refresh=True),
+            session=http_session,
+            clock=self._clock,
+            stop_event=self._stop_event,
+        )
 
-    def __call__(self) -> None:
+    def _get_bearer_token(self, refresh: bool = False) -> str:
+        key = self._env_param.BEARER_TOKEN
+        if refresh:
+            # 401 が返ってきた場合はキャッシュを破棄して取得しなおす
+            self._secret_cache.invalidate(key)
+        else:
+            bearer_token = self._secret_cache.get(key)
+            if bearer_token is not None:
+                return bearer_token
+        bearer_token = self._aws_resource.get_value_from_ssm(key)
+        self._secret_cache.put(key, bearer_token)
+        return bearer_token
+
+    def __call__(self) -> bool:
         print(
             f"service start! target liked user id is {self._env_param.LIKED_USER_ID}")
         print(f"start at: {now_isof()}")
         try:
-            self._service()
+            found_new = self._service()
         except Exception as e:
             print(f"An Error occurrence at: {now_isof()}")
             raise e
         print(f"end at: {now_isof()}")
-
-    def _service(self) -> None:
-
-        bearer_token = self._aws_resource.get_value_from_ssm(
-            self._env_param.BEARER_TOKEN)
-        api = TwitterApi(bearer_token=bearer_token)
+        return found_new
+
+    def serve(self, interval: AdaptiveInterval) -> None:
+        # 常駐モード. HTTP・AWS のクライアントや取得済みIDのキャッシュを保持したまま,
+        # interval に従って繰り返し走査する. SIGTERM/SIGINT で現在のツイートの処理後に停止する
+        # PAGETOKE_RESET=False の場合, 保存した pagetoken からの走査を1度終えた後は最新のいいねから走査する
+        import requests
+        self._api = self.build_api(http_session=requests.Session())
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, lambda *_: self.stop())
+        while not self._stop_event.is_set():
+            found_new = False
+            try:
+                found_new = self()
+                self._scan_from_latest = True
+            except Exception as e:
+                # 常駐モードでは例外で停止せず, 次回の走査で再試行する
+                print(f"scan failed: {e}")
+            if self._stop_event.is_set():
+                break
+            wait_time = interval.next(found_new)
+            print(f"next scan in {wait_time:.0f} sec")
+            self._clock.wait(self._stop_event, wait_time)
+        self.close()
+        print(f"daemon stopped at: {now_isof()}")
+
+    def stop(self) -> None:
+        print("stop requested")
+        self._stop_event.set()
+
+    def close(self) -> None:
+        # 実行待ちの後処理(サムネイル生成)の完了を待つ
+        if self._thumbnail_stage is not None:
+            self._thumbnail_stage.close()
+        if self._search_index is not None:
+            self._search_index.close()
+
+    def _service(self) -> bool:
+
+        if self._api is None:
+            self._api = self.build_api()
+        api = self._api
         page_token = None
-        if not self._env_param.PAGETOKE_RESET:
+        ids = None
+        latest_id = None
+        if self._env_param.PAGETOKE_RESET or self._scan_from_latest:
+            # 最新のいいねから走査する場合, 先頭ページのみで新着の有無を判定する
+            # 新着がなければ DynamoDB には一切アクセスせずに終了する
+            try:
+                ids = api.get_liked_tweets(self._env_param.LIKED_USER_ID)
+            except WaitInterrupted:
+                return False
+            if len(ids.get("data", [])) != 0:
+                latest_id = ids["data"][0]["id"]
+            if latest_id is not None and latest_id == self._read_latest_liked_id():
+                print(f"nothing new since {latest_id}")
+                return False
+        else:
             page_token = self._aws_resource.get_pagetoken()
 
+        found_new = self._scan(api, page_token, ids)
+        if latest_id is not None and not self._stop_event.is_set():
+            self._write_latest_liked_id(latest_id)
+        return found_new
+
+    def _latest_liked_id_path(self) -> Path:
+        return self._output_dir / f".latest_liked_id_{self._env_param.LIKED_USER_ID}"
+
+    def _read_latest_liked_id(self) -> str | None:
+        path = self._latest_liked_id_path()
+        if not path.exists():
+            return None
+        return path.read_text(encoding="utf-8").strip()
+
+    def _write_latest_liked_id(self, latest_id: str) -> None:
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        self._latest_liked_id_path().write_text(latest_id, encoding="utf-8")
+
+    def _scan(self, api: TwitterApi, page_token: str | None, ids: dict | None) -> bool:
+        # 1件でも新規にダウンロードした場合Trueを返す
+        found_new = False
         while True:
-            print(f"start get liked tweets at {page_token}")
-            ids = api.get_liked_tweets(
-                self._env_param.LIKED_USER_ID, page_token)
+            if ids is None:
+                print(f"start get liked tweets at {page_token}")
+                try:
+                    ids = api.get_liked_tweets(
+                        self._env_param.LIKED_USER_ID, page_token)
+                except WaitInterrupted:
+                    # 停止要求. 現在の page_token は保存済みのため, そのまま終了
+                    return found_new
             is_fin = True
             # いいねが取得できなかった場合, 処理終了
             if len(ids.get("data", [])) == 0:
-                return
+                return found_new
+            # ページ内のツイートの詳細を取得し, 取得対象のメディアのみを取り出す
+            tweet_infos = []
             for data in ids["data"]:
+                if self._stop_event.is_set():
+                    break
                 try:
-                    tweet_info = api.get_statuses_show(data["id"])
-                except DoseNotExistException:
-                    # 詳細情報が取得できなかった場合skip
-                    continue
-                if "extended_entities" not in tweet_info.keys():
-                    continue
-                if "media" not in tweet_info["extended_entities"].keys():
-                    continue
-                try:
-                    is_skip = self._downdload_and_write_db(
-                        tweet_info, self._output_dir)
-                    if not is_skip:
-                        is_fin = False
-                except Exception as e:
-                    # Twitter API 周り以外で例外が発生した場合
-                    # 先にpage_tokenを表示させる
-                    print(f"Current page token is: {page_token}")
-                    self._aws_resource.put_pagetoken(page_token)
-                    raise e
+                    tweet_info = self.fetch_media_tweet(api, data["id"])
+                except WaitInterrupted:
+                    # 停止要求. 後続の処理で現在の page_token を保存して終了する
+                    break
+                if tweet_info is not None:
+                    tweet_infos.append(tweet_info)
+            work_items = extract_media_work_items(
+                tweet_infos, self._env_param.INCLUDE_VIDEO)
+            try:
+                is_skip = self._download_work_items(
+                    work_items, self._output_dir)
+                if not is_skip:
+                    is_fin = False
+                    found_new = True
+            except Exception as e:
+                # Twitter API 周り以外で例外が発生した場合
+                # 先にpage_tokenを表示させる
+                print(f"Current page token is: {page_token}")
+                self._aws_resource.put_pagetoken(page_token)
+                raise e
+            if self._stop_event.is_set():
+                # 停止要求があった場合, 現在のページから再開できるよう保存して終了
+                print(f"Current page token is: {page_token}")
+                self._aws_resource.put_pagetoken(page_token)
+                return found_new
             page_token = ids["meta"]["next_token"]
             self._aws_resource.put_pagetoken(page_token)
+            ids = None
             if is_fin:
-                return
+                return found_new
 
-    def _downdload_and_write_db(self, tweet_info: dict, output_dir: Path) -> None:
-        id = tweet_info["id_str"]
-        text = tweet_info["text"]
-        user_name = tweet_info["user"]["name"]
-        user_screen_name = tweet_info["user"]["screen_name"]
-        hashtag = hashtags_to_str(tweet_info["entities"]["hashtags"])
-        created_at = twitter_to_jst_timezone(tweet_info["created_at"])
+    def fetch_media_tweet(self, api: TwitterApi, tweet_id: str) -> dict | None:
+        negative_key = build_tweet_key(tweet_id)
+        if self._negative_cache.get(negative_key) is not None:
+            # 削除済みであることが分かっている場合, API を呼ばずにskip
+            return None
+        try:
+            tweet_info = api.get_statuses_show(tweet_id)
+        except DoseNotExistException:
+            # 詳細情報が取得できなかった場合skip
+            self._negative_cache.put(negative_key, TWEET_NOT_FOUND)
+            return None
+        self._negative_cache.invalidate(negative_key)
+        if "extended_entities" not in tweet_info.keys():
+            return None
+        if "media" not in tweet_info["extended_entities"].keys():
+            return None
+        return tweet_info
+
+    def process_tweet(self, api: TwitterApi, tweet_id: str) -> bool:
+        # 1ツイート分の取得・保存を行う. 新規にダウンロードしなかった場合True
+        tweet_info = self.fetch_media_tweet(api, tweet_id)
+        if tweet_info is None:
+            return True
+        return self._downdload_and_write_db(tweet_info, self._output_dir)
+
+    def _downdload_and_write_db(self, tweet_info: dict, output_dir: Path) -> bool:
+        return self._download_work_items(
+            extract_media_work_items([tweet_info], self._env_param.INCLUDE_VIDEO), output_dir)
+
+    def _download_work_items(self, work_items: list, output_dir: Path) -> bool:
+        # 新規にダウンロードしなかった場合True
         is_skip = True
-        # 1ツイート内で投稿されているメディア分ループ
-        for idx, extended_entity in enumerate(tweet_info["extended_entities"]["media"]):
-            # 投稿されたメディアが画像でない場合, 次のメディアへ
-            if extended_entity["type"] != "photo":
+        # ツイートの共通項目は, ダウンロードするメディアがある場合のみ1回だけ解析する
+        tweet_properties = {}
+        for work_item in work_items:
+            if self._stop_event.is_set():
+                break
+            output_file_stem = work_item.stem
+            negative_key = build_media_key(output_file_stem)
+            # 取得できないことが分かっていれば, 次のメディアへ
+            if self._negative_cache.get(negative_key) is not None:
+                print(f"skip not found media at {output_file_stem}")
                 continue
-            output_file_stem = build_file_name_stem(id, idx)
             # すでに取得済みであれば, 次のメディアへ
             if self._aws_resource.has_property_item(output_file_stem):
                 print(f"skip at {output_file_stem}")
                 continue
-            img = download_img(extended_entity["media_url_https"])
-            if img is None:
+            try:
+                if work_item.media_type == "photo":
+                    data = download_img(
+                        work_item.url, self._partial_dir, self._clock, self._stop_event)
+                else:
+                    data = download_video(
+                        work_item.url, self._partial_dir, self._clock, self._stop_event)
+            except WaitInterrupted:
+                # 停止要求. 受信済みの分は partial_dir に残り, 次回の実行で続きから取得する
+                break
+            if data is None:
+                self._negative_cache.put(negative_key, MEDIA_NOT_FOUND)
                 continue
-            output_file_path = make_output_path(
-                output_dir, created_at, id, idx)
-            write_time = write_img(output_file_path, img)
-            print(f"write to img -> {output_file_path}")
-            self._aws_resource.put_property(
-                item={
-                    "partition_key": output_file_stem,
-                    "created_at": created_at.isoformat(),
-                    "text": text,
-                    "user_name": user_name,
-                    "user_screen_name": user_screen_name,
-                    "hashtag": hashtag,
-                    "write_time": write_time,
-                }
-            )
+            self._negative_cache.invalidate(negative_key)
+            id = work_item.tweet_info["id_str"]
+            if id not in tweet_properties:
+                tweet_properties[id] = build_tweet_property(
+                    work_item.tweet_info)
+            created_at, tweet_property = tweet_properties[id]
+            written = self._output_sink.write(
+                created_at, id, work_item.index, data, work_item.suffix)
+            if self._thumbnail_stage is not None and work_item.media_type == "photo":
+                self._thumbnail_stage.submit(
+                    build_output_path(output_dir, created_at, id, work_item.index), data)
+            item = {
+                "partition_key": output_file_stem,
+                **tweet_property,
+                **written,
+            }
+            if work_item.media_type != "photo":
+                item["media_type"] = work_item.media_type
+            self._aws_resource.put_property(item=item)
+            if self._search_index is not None:
+                self._search_index.add(item)
             # Too Many Requests 対策
-            time.sleep(3)
+            self._clock.sleep(self._env_param.DOWNLOAD_INTERVAL)
             # 1回でもダウンロードした場合False
             is_skip = False
         return is_skip
 
 
-if __name__ == "__main__":
-
-    param = EnvironParamaters(
+def load_environ_paramaters() -> EnvironParamaters:
+    return EnvironParamaters(
         BEARER_TOKEN=os.environ["BEARER_TOKEN"],
         LIKED_USER_ID=os.environ["LIKED_USER_ID"],
         PROPERTY_DB_NAME=os.environ["PROPERTY_DB_NAME"],
@@ -275,10 +667,59 @@ if __name__ == "__main__":
         OUTPUT_DIR=os.environ["DIR_NAME"],
         PAGETOKE_RESET=(os.environ["PAGETOKE_RESET"] in [
                         "true", "True", "TRUE"]),
+        SECRET_CACHE_PATH=os.environ.get("SECRET_CACHE_PATH", ""),
+        SECRET_CACHE_TTL=int(os.environ.get("SECRET_CACHE_TTL", "3600")),
+        OUTPUT_FORMAT=os.environ.get("OUTPUT_FORMAT", "file"),
+        S3_BUCKET=os.environ.get("S3_BUCKET", ""),
+        S3_PREFIX=os.environ.get("S3_PREFIX", ""),
+        INCLUDE_VIDEO=(os.environ.get("INCLUDE_VIDEO", "false") in [
+                       "true", "True", "TRUE"]),
+        NEGATIVE_CACHE_PATH=os.environ.get("NEGATIVE_CACHE_PATH", ""),
+        NEGATIVE_CACHE_TTL=int(os.environ.get(
+            "NEGATIVE_CACHE_TTL", str(7 * 24 * 3600))),
+        NEGATIVE_CACHE_REVERIFY=(os.environ.get("NEGATIVE_CACHE_REVERIFY", "false") in [
+                                 "true", "True", "TRUE"]),
+        DOWNLOAD_INTERVAL=float(os.environ.get("DOWNLOAD_INTERVAL", "3")),
     )
-    action = Action(
+
+
+def build_action(param: EnvironParamaters) -> Action:
+    # 任意の後処理(サムネイル生成・検索インデックス)は環境変数が設定されている場合のみ有効にする
+    thumbnail_stage = None
+    if os.environ.get("THUMBNAIL_DIR"):
+        thumbnail_stage = ThumbnailStage(
+            output_dir=Path(param.OUTPUT_DIR),
+            thumb_dir=Path(os.environ["THUMBNAIL_DIR"]),
+            size=int(os.environ.get("THUMBNAIL_SIZE", "256")),
+            format=os.environ.get("THUMBNAIL_FORMAT", "webp"),
+        )
+    search_index = None
+    if os.environ.get("SEARCH_INDEX_PATH"):
+        search_index = SearchIndex(Path(os.environ["SEARCH_INDEX_PATH"]))
+    return Action(
         env_param=param,
         output_dir=Path(param.OUTPUT_DIR),
+        thumbnail_stage=thumbnail_stage,
+        search_index=search_index,
     )
 
-    action()
+
+def main() -> None:
+    param = load_environ_paramaters()
+    action = build_action(param)
+
+    if os.environ.get("DAEMON_MODE", "false") in ["true", "True", "TRUE"]:
+        action.serve(AdaptiveInterval(
+            base=float(os.environ.get("POLL_INTERVAL", "300")),
+            max_interval=float(os.environ.get("POLL_MAX_INTERVAL", "3600")),
+            jitter=float(os.environ.get("POLL_JITTER", "0.1")),
+        ))
+    else:
+        try:
+            action()
+        finally:
+            action.close()
+
+
+if __name__ == "__main__":
+    main()
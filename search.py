@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from src.search_index import SearchIndex, load_table_export
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="いいねしたツイートの全文検索")
+    parser.add_argument("--index", type=Path, required=True,
+                        help="検索インデックス(SQLite)のパス")
+    sub = parser.add_subparsers(dest="command", required=True)
+    query_parser = sub.add_parser(
+        "query", help="検索する. #タグ でハッシュタグ, @名前 でユーザーを指定できる")
+    query_parser.add_argument("terms", nargs="+")
+    query_parser.add_argument("--output-dir", type=Path, default=None,
+                              help="指定した場合, 画像のパスを OUTPUT_DIR からの絶対パスで表示する")
+    query_parser.add_argument("--limit", type=int, default=100)
+    rebuild_parser = sub.add_parser(
+        "rebuild", help="プロパティ用DynamoDB(もしくはそのエクスポート)から作り直す")
+    rebuild_parser.add_argument("--export", type=Path, default=None,
+                                help="DynamoDB のエクスポート(DYNAMODB_JSON). 省略時はテーブルを直接 scan する")
+    args = parser.parse_args()
+
+    with SearchIndex(args.index) as index:
+        if args.command == "query":
+            start = time.perf_counter()
+            results = index.search(" ".join(args.terms), args.limit)
+            elapsed = time.perf_counter() - start
+            for result in results:
+                location = result["location"]
+                if args.output_dir is not None and not location.startswith("s3:"):
+                    location = str(args.output_dir / location)
+                print(f"{location}\t{result['text']}")
+            print(f"{len(results)} hits in {elapsed * 1000:.1f} ms")
+        elif args.command == "rebuild":
+            if args.export is not None:
+                items = load_table_export(args.export)
+            else:
+                from run import AwsResource, load_environ_paramaters
+                items = AwsResource(load_environ_paramaters()).scan_properties()
+            count = index.rebuild(items)
+            print(f"indexed {count} items -> {args.index}")
+
+
+if __name__ == "__main__":
+    main()
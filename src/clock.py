@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Protocol
+
+
+class Clock(Protocol):
+    # 待ち時間を伴う処理に注入する時計
+
+    def now(self) -> float:
+        ...
+
+    def sleep(self, seconds: float) -> None:
+        ...
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        ...
+
+
+class SystemClock:
+    # 実時間の時計. 待ちは time.sleep / Event.wait で実際に待つ
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        # テストで time.sleep を差し替えられるよう, 呼び出し時に参照する
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        # event が set されるか seconds 経過するまで待つ. set された場合True
+        return event.wait(seconds)
+
+
+class VirtualClock:
+    # シミュレーション・テスト用の仮想時刻の時計. 待ちは実際には待たずに時刻を進める
+
+    def __init__(self, start: float = 0.0) -> None:
+        self._now = start
+        self._lock = threading.Lock()
+        self.sleeps = []
+
+    def now(self) -> float:
+        with self._lock:
+            return self._now
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.advance(seconds)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        if not event.is_set():
+            self.sleeps.append(seconds)
+            self.advance(seconds)
+        return event.is_set()
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class WaitInterrupted(Exception):
+    # 停止要求によりリトライの待ちが打ち切られた場合
+    pass
+
+
+def sleep_unless_stopped(clock: Clock, seconds: float, stop_event: threading.Event | None = None) -> None:
+    # stop_event を指定した場合, 待ちの途中で set されたら WaitInterrupted を送出する
+    if stop_event is None:
+        clock.sleep(seconds)
+    elif clock.wait(stop_event, seconds):
+        raise WaitInterrupted()
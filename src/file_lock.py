@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+import os
+
+
+def lock_exclusive(f) -> None:
+    # 開いたファイルに排他ロックを取る. ロックはファイルを閉じると解放される
+    # fcntl のない環境(Windows)ではロックしない. 並列バックフィルは POSIX のみ対応
+    if os.name != "posix":
+        return
+    import fcntl
+    fcntl.flock(f, fcntl.LOCK_EX)
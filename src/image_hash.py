@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# 1画像あたり aHash/dHash/pHash の3種類(各64bit)を保持する
+HASH_KINDS = ("ahash", "dhash", "phash")
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+_POPCOUNT_TABLE = np.array([bin(i).count("1")
+                           for i in range(256)], dtype=np.uint8)
+# find_duplicates で指定できる最大の距離
+MAX_DUPLICATE_DISTANCE = 10
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    # DCT-II の変換行列. X の2次元DCTは D @ X @ D.T で求まる
+    k = np.arange(size).reshape(-1, 1)
+    n = np.arange(size).reshape(1, -1)
+    result = np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    result[0] *= 1 / np.sqrt(2)
+    return result * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def load_gray(path: Path) -> tuple[np.ndarray, np.ndarray]:
+    # pHash/aHash 用の 32x32 と dHash 用の 9x8 のグレースケール画像を返す
+    with Image.open(path) as img:
+        gray = img.convert("L")
+        large = gray.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR)
+        small = gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.BILINEAR)
+    return np.asarray(large, dtype=np.float32), np.asarray(small, dtype=np.float32)
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    # (N, 8, 8) の bool 配列を (N,) の uint64 に詰める
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return packed.view(">u8").reshape(-1).astype(np.uint64)
+
+
+def compute_hashes(large: np.ndarray, small: np.ndarray) -> np.ndarray:
+    # large: (N, 32, 32), small: (N, 8, 9) から (N, 3) の uint64 を返す
+    n = len(large)
+    if n == 0:
+        return np.empty((0, len(HASH_KINDS)), dtype=np.uint64)
+    # aHash: 8x8 に縮小した画素が平均より明るいか
+    block = _DCT_SIZE // _HASH_SIZE
+    reduced = large.reshape(n, _HASH_SIZE, block,
+                            _HASH_SIZE, block).mean(axis=(2, 4))
+    ahash = reduced > reduced.mean(axis=(1, 2), keepdims=True)
+    # dHash: 隣り合う画素の輝度勾配
+    dhash = small[:, :, 1:] > small[:, :, :-1]
+    # pHash: DCT の低周波成分が中央値より大きいか
+    dct = np.matmul(np.matmul(_DCT, large), _DCT.T)
+    low = dct[:, :_HASH_SIZE, :_HASH_SIZE]
+    phash = low > np.median(low.reshape(n, -1), axis=1).reshape(n, 1, 1)
+    return np.stack([pack_bits(ahash), pack_bits(dhash), pack_bits(phash)], axis=1)
+
+
+def hash_files(paths: list[Path], workers: int = 4) -> tuple[list[Path], np.ndarray]:
+    # 画像のデコードはスレッドで並列化し, ハッシュの計算はまとめてベクトル化する
+    # 読み込めなかった画像は結果から除外する
+    def load(path: Path):
+        try:
+            return load_gray(path)
+        except (OSError, ValueError) as e:
+            print(f"skip unreadable image {path}: {e}")
+            return None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        loaded = list(executor.map(load, paths))
+    ok_paths = [path for path, data in zip(paths, loaded) if data is not None]
+    ok_data = [data for data in loaded if data is not None]
+    if not ok_data:
+        return [], np.empty((0, len(HASH_KINDS)), dtype=np.uint64)
+    large = np.stack([data[0] for data in ok_data])
+    small = np.stack([data[1] for data in ok_data])
+    return ok_paths, compute_hashes(large, small)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def hamming_distance(hashes: np.ndarray, value: int) -> np.ndarray:
+    return popcount(np.bitwise_xor(hashes, np.uint64(value)))
+
+
+def iter_image_files(output_dir: Path) -> list[Path]:
+    return sorted(output_dir.glob("yyyy=*/mm=*/dd=*/*.png"))
+
+
+class HashIndex:
+    # 画像の相対パスと (N, 3) の uint64 配列からなる知覚ハッシュのインデックス
+
+    def __init__(self, keys: list[str] = None, hashes: np.ndarray = None) -> None:
+        self.keys = list(keys) if keys is not None else []
+        if hashes is None:
+            hashes = np.empty((0, len(HASH_KINDS)), dtype=np.uint64)
+        self.hashes = hashes.astype(np.uint64)
+        self._key_set = set(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_set
+
+    @classmethod
+    def load(cls, path: Path) -> HashIndex:
+        if not path.exists():
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["keys"].tolist(), data["hashes"])
+
+    def save(self, path: Path) -> None:
+        # 書き込み途中で中断しても既存のインデックスを壊さないよう, 一時ファイル経由で置き換える
+        tmp_path = path.with_name(f"{path.name}.tmp.npz")
+        np.savez(tmp_path, keys=np.array(self.keys, dtype=str),
+                 hashes=self.hashes)
+        tmp_path.replace(path)
+
+    def add(self, keys: list[str], hashes: np.ndarray) -> None:
+        self.keys.extend(keys)
+        self._key_set.update(keys)
+        self.hashes = np.concatenate([self.hashes, hashes.astype(np.uint64)])
+
+    def update(self, output_dir: Path, batch_size: int = 256, workers: int = 4) -> int:
+        # インデックス未登録の画像のみハッシュを計算して追加する
+        new_paths = [path for path in iter_image_files(output_dir)
+                     if path.relative_to(output_dir).as_posix() not in self]
+        for start in range(0, len(new_paths), batch_size):
+            ok_paths, hashes = hash_files(
+                new_paths[start:start + batch_size], workers)
+            self.add([path.relative_to(output_dir).as_posix()
+                     for path in ok_paths], hashes)
+        return len(new_paths)
+
+    def query(self, value: int, max_distance: int, kind: str = "phash") -> list[tuple[str, int]]:
+        # ハミング距離が max_distance 以下の画像を距離の近い順に返す
+        distances = hamming_distance(
+            self.hashes[:, HASH_KINDS.index(kind)], value)
+        hits = np.flatnonzero(distances <= max_distance)
+        hits = hits[np.argsort(distances[hits], kind="stable")]
+        return [(self.keys[i], int(distances[i])) for i in hits]
+
+    def find_duplicates(self, max_distance: int, kind: str = "phash") -> list[tuple[str, str, int]]:
+        # multi-index hashing で近似重複の組を列挙する
+        # 64bit を m 個のブロックに分けると, 距離が max_distance 以下の組は少なくとも1つの
+        # ブロックで距離が max_distance // m 以下になる(鳩の巣原理)ため, その組のみ検証する
+        # 候補の組はバッチ毎に距離を検証して一致した組のみ残すため, メモリ使用量は結果の件数に比例する
+        # 反転させるビットの組み合わせは max_distance とともに急増するため, MAX_DUPLICATE_DISTANCE までとする
+        if not 0 <= max_distance <= MAX_DUPLICATE_DISTANCE:
+            raise ValueError(
+                f"max_distance must be between 0 and {MAX_DUPLICATE_DISTANCE}: {max_distance}")
+        column = np.ascontiguousarray(
+            self.hashes[:, HASH_KINDS.index(kind)])
+        n = len(column)
+        if n < 2:
+            return []
+        # 1ブロックのビット数が log2(N) 程度になるよう分割数を決める
+        # 各ブロックの値の出現位置を表引きするため, 1ブロックは22bit以下に抑える
+        chunks = max(3, min(max_distance + 1, 64 //
+                     max(1, int(np.ceil(np.log2(n))))))
+        sub_distance = max_distance // chunks
+        bounds = np.linspace(0, 64, chunks + 1).astype(int)
+        hits = [np.empty(0, dtype=np.int64)]
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            width = int(high - low)
+            values = ((column >> np.uint64(low)) &
+                      np.uint64((1 << width) - 1)).astype(np.int64)
+            order = np.argsort(values, kind="stable")
+            counts = np.bincount(values, minlength=1 << width)
+            starts = np.cumsum(counts) - counts
+            for flip in _flip_masks(width, sub_distance):
+                for left, right in _iter_matches(values ^ flip, counts, starts, order):
+                    distances = popcount(np.bitwise_xor(
+                        column[left], column[right]))
+                    keep = distances <= max_distance
+                    hits.append(left[keep] * n + right[keep])
+        # 複数のブロックで一致した組の重複を除く
+        pairs = np.unique(np.concatenate(hits))
+        left, right = pairs // n, pairs % n
+        distances = popcount(np.bitwise_xor(column[left], column[right]))
+        return [(self.keys[i], self.keys[j], int(distance))
+                for i, j, distance in zip(left, right, distances)]
+
+
+def _flip_masks(width: int, distance: int) -> list[int]:
+    # width ビットのうち distance 個以下のビットを反転させるマスクの一覧
+    result = [0]
+    for count in range(1, distance + 1):
+        result.extend(sum(1 << bit for bit in bits)
+                      for bits in combinations(range(width), count))
+    return result
+
+
+def _iter_matches(queries: np.ndarray, counts: np.ndarray, starts: np.ndarray, order: np.ndarray,
+                  batch_size: int = 1 << 22):
+    # queries[i] とブロックの値が一致する j を表引きし, i < j の組を (i の配列, j の配列) で返す
+    # 1度に展開する組が batch_size 程度に収まるよう, queries を区切って返す
+    n = len(order)
+    hit_counts = counts[queries]
+    ends = np.cumsum(hit_counts)
+    begin = 0
+    while begin < n:
+        base = int(ends[begin] - hit_counts[begin])
+        end = max(begin + 1, int(np.searchsorted(
+            ends, base + batch_size, side="right")))
+        batch_counts = hit_counts[begin:end]
+        total = int(ends[end - 1]) - base
+        src = np.repeat(np.arange(begin, end), batch_counts)
+        offsets = np.arange(total) - \
+            np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+        dst = order[np.repeat(starts[queries[begin:end]],
+                              batch_counts) + offsets]
+        keep = src < dst
+        yield src[keep], dst[keep]
+        begin = end
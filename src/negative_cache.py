@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+from src.file_lock import lock_exclusive
+
+# 削除済みのツイート / 取得できないメディア
+TWEET_NOT_FOUND = "tweet_not_found"
+MEDIA_NOT_FOUND = "media_not_found"
+
+
+def build_tweet_key(tweet_id: str) -> str:
+    return f"tweet#{tweet_id}"
+
+
+def build_media_key(stem: str) -> str:
+    return f"media#{stem}"
+
+
+class NegativeCache:
+    # 404 となったツイート・メディアを TTL 付きで記録し, 次回以降の走査で API を呼ばずにスキップする
+    # TTL を過ぎた記録は再確認の対象となる. reverify=True の場合は記録を無視して全て再確認する
+    # path を指定しない場合はプロセス内のみのキャッシュとなる(常駐モードでは走査をまたいで有効)
+
+    def __init__(self, path: Path | None = None, ttl: int = 7 * 24 * 3600, reverify: bool = False) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.reverify = reverify
+        self._entries = self._read_file()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        # 有効な記録があればその状態を返す
+        entry = self._entries.get(key)
+        if self.reverify or entry is None or entry["checked_at"] + self.ttl <= time.time():
+            return None
+        return entry["status"]
+
+    def put(self, key: str, status: str) -> None:
+        entry = {"status": status, "checked_at": time.time()}
+        self._entries[key] = entry
+        self._update_file(lambda entries: entries.__setitem__(key, entry))
+
+    def invalidate(self, key: str) -> None:
+        # 再確認で取得できた場合に記録を削除する
+        if self._entries.pop(key, None) is not None:
+            self._update_file(lambda entries: entries.pop(key, None))
+
+    def _read_file(self) -> dict:
+        if self.path is None or not self.path.exists():
+            return {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _update_file(self, update) -> None:
+        # バックフィルの他のワーカーが書き込んだ記録を消さないよう,
+        # ロックファイルの排他ロックを取ってから読み直し, 置き換える
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(f"{self.path.name}.lock")
+        with lock_path.open("a") as lock:
+            lock_exclusive(lock)
+            entries = self._read_file()
+            update(entries)
+            tmp_path = self.path.with_name(
+                f"{self.path.name}.{os.getpid()}.tmp")
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import datetime
+from pathlib import Path
+
+# 保存先のパスと書き込み時刻の形式. run.py と出力先(src/output_sink.py)の両方から使う
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+def now_isof() -> str:
+    return datetime.datetime.now(JST).isoformat()
+
+
+def write_img(path: Path, data: bin) -> str:
+    with path.open("wb") as f:
+        f.write(data)
+    return now_isof()
+
+
+def make_output_path(output_dir: Path, created_at: datetime.datetime, id: str, index: int,
+                     suffix: str = ".png") -> Path:
+    result = output_dir
+    result.mkdir(exist_ok=True)
+    result /= f"yyyy={created_at.year}"
+    result.mkdir(exist_ok=True)
+    result /= f"mm={str(created_at.month).zfill(2)}"
+    result.mkdir(exist_ok=True)
+    result /= f"dd={str(created_at.day).zfill(2)}"
+    result.mkdir(exist_ok=True)
+    result /= f"{build_file_name_stem(id, index)}{suffix}"
+    return result
+
+
+def build_output_path(output_dir: Path, created_at: datetime.datetime, id: str, index: int,
+                      suffix: str = ".png") -> Path:
+    # make_output_path と同じパスを, ディレクトリを作成せずに返す
+    return output_dir / f"yyyy={created_at.year}" / f"mm={str(created_at.month).zfill(2)}" / \
+        f"dd={str(created_at.day).zfill(2)}" / f"{build_file_name_stem(id, index)}{suffix}"
+
+
+def build_shard_path(output_dir: Path, created_at: datetime.datetime) -> Path:
+    # OUTPUT_DIR/yyyy=/mm=/dd=XX.tar
+    return output_dir / f"yyyy={created_at.year}" / f"mm={str(created_at.month).zfill(2)}" / \
+        f"dd={str(created_at.day).zfill(2)}.tar"
+
+
+def build_file_name_stem(id: str, index: int) -> str:
+    return f"{id}_{index}"
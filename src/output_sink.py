@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import datetime
+import io
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src.output_path import (build_file_name_stem, build_output_path,
+                             build_shard_path, make_output_path, now_isof,
+                             write_img)
+from src.shard_archive import ShardArchive, ShardArchiveReader
+
+if TYPE_CHECKING:
+    # boto3 の import は重いため, 実際に利用するまで遅延させる
+    import boto3
+
+    from run import AwsResource, EnvironParamaters
+
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".mp4": "video/mp4",
+}
+
+
+class LocalFileSink():
+    # 1画像1ファイルとして OUTPUT_DIR/yyyy=/mm=/dd=/{id}_{index}.png に保存する
+
+    def __init__(self, output_dir: Path) -> None:
+        self.output_dir = output_dir
+
+    def write(self, created_at: datetime.datetime, id: str, index: int, data: bin,
+              suffix: str = ".png") -> dict:
+        # プロパティに追加する項目を返す
+        output_file_path = make_output_path(
+            self.output_dir, created_at, id, index, suffix)
+        write_time = write_img(output_file_path, data)
+        print(f"write to img -> {output_file_path}")
+        return {
+            "write_time": write_time,
+        }
+
+
+class ShardArchiveSink():
+    # 日毎の非圧縮tarシャード OUTPUT_DIR/yyyy=/mm=/dd=XX.tar に追記する
+    # 小さなファイルが大量にできることによる, ファイル毎のメタデータ・アップロードの負荷を避ける
+
+    def __init__(self, output_dir: Path) -> None:
+        self.output_dir = output_dir
+
+    def write(self, created_at: datetime.datetime, id: str, index: int, data: bin,
+              suffix: str = ".png") -> dict:
+        shard_path = build_shard_path(self.output_dir, created_at)
+        offset, size = ShardArchive(shard_path).append(
+            f"{build_file_name_stem(id, index)}{suffix}", data)
+        print(f"write to img -> {shard_path}:{build_file_name_stem(id, index)}")
+        return {
+            "write_time": now_isof(),
+            "archive": shard_path.relative_to(self.output_dir).as_posix(),
+            "offset": offset,
+            "size": size,
+        }
+
+
+def build_s3_key(prefix: str, created_at: datetime.datetime, id: str, index: int,
+                 suffix: str = ".png") -> str:
+    # {prefix}/yyyy=/mm=/dd=/{id}_{index}.png
+    key = build_output_path(Path(), created_at, id, index, suffix).as_posix()
+    if prefix:
+        key = f"{prefix.strip('/')}/{key}"
+    return key
+
+
+class S3Sink():
+    # ローカルに書き出さず, s3://bucket/{prefix}/yyyy=/mm=/dd=/{id}_{index}.png に直接アップロードする
+    # multipart_threshold 以上の画像は, パートを max_concurrency 並列でマルチパートアップロードする
+
+    def __init__(self, bucket: str, session: boto3.Session = None, prefix: str = "",
+                 multipart_threshold: int = 8 * 1024 * 1024, max_concurrency: int = 8) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.max_concurrency = max_concurrency
+        self._session = session
+        self._client = None
+
+    @property
+    def client(self):
+        # コネクションプールはマルチパートの並列数に合わせる
+        if self._client is None:
+            from botocore.config import Config
+            if self._session is None:
+                import boto3
+                self._session = boto3.Session()
+            self._client = self._session.client(
+                "s3", config=Config(max_pool_connections=self.max_concurrency))
+        return self._client
+
+    def write(self, created_at: datetime.datetime, id: str, index: int, data: bin,
+              suffix: str = ".png") -> dict:
+        key = build_s3_key(self.prefix, created_at, id, index, suffix)
+        content_type = CONTENT_TYPES.get(suffix, "application/octet-stream")
+        if len(data) < self.multipart_threshold:
+            res = self.client.put_object(
+                Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+            etag = res["ETag"]
+        else:
+            from boto3.s3.transfer import TransferConfig
+            self.client.upload_fileobj(
+                io.BytesIO(data), self.bucket, key,
+                ExtraArgs={"ContentType": content_type},
+                Config=TransferConfig(
+                    multipart_threshold=self.multipart_threshold,
+                    multipart_chunksize=self.multipart_threshold,
+                    max_concurrency=self.max_concurrency,
+                ),
+            )
+            # upload_fileobj は ETag を返さないため, 改めて取得する
+            etag = self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+        print(f"write to img -> s3://{self.bucket}/{key}")
+        return {
+            "write_time": now_isof(),
+            "s3_key": key,
+            "etag": etag.strip('"'),
+        }
+
+
+def read_archived_img(output_dir: Path, created_at: datetime.datetime, id: str, index: int,
+                      suffix: str = ".png") -> bin:
+    # ShardArchiveSink で保存した画像を読み出す
+    with ShardArchiveReader(build_shard_path(output_dir, created_at)) as reader:
+        return reader.read(f"{build_file_name_stem(id, index)}{suffix}")
+
+
+def build_output_sink(env_param: EnvironParamaters, output_dir: Path, aws_resource: AwsResource):
+    if env_param.OUTPUT_FORMAT == "file":
+        return LocalFileSink(output_dir)
+    if env_param.OUTPUT_FORMAT == "tar":
+        return ShardArchiveSink(output_dir)
+    if env_param.OUTPUT_FORMAT == "s3":
+        if not env_param.S3_BUCKET:
+            raise ValueError("S3_BUCKET is required when OUTPUT_FORMAT is s3")
+        return S3Sink(env_param.S3_BUCKET, aws_resource.session, env_param.S3_PREFIX)
+    raise ValueError(f"unknown OUTPUT_FORMAT: {env_param.OUTPUT_FORMAT}")
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from pathlib import Path
+
+_CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class IncompleteDownloadError(OSError):
+    # 受信したデータ長が Content-Length / Content-Range の値と一致しない場合
+    pass
+
+
+def build_partial_path(partial_dir: Path, url: str) -> Path:
+    return partial_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.part"
+
+
+def build_validator(headers) -> str | None:
+    # If-Range に使える値を返す. 弱い ETag は If-Range に使えないため Last-Modified を使う
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+class PartialDownload:
+    # 中断したダウンロードの受信済みデータを partial_dir に保持し, HTTP Range で続きから取得する
+    # 再開時は保存した ETag / Last-Modified を If-Range で送り, サーバー上で変更されていれば最初から取り直す
+
+    def __init__(self, partial_dir: Path, url: str) -> None:
+        self.url = url
+        self.part_path = build_partial_path(partial_dir, url)
+        self.meta_path = self.part_path.with_suffix(".meta")
+
+    def size(self) -> int:
+        return self.part_path.stat().st_size if self.part_path.exists() else 0
+
+    def load_meta(self) -> dict:
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def discard(self) -> None:
+        self.part_path.unlink(missing_ok=True)
+        self.meta_path.unlink(missing_ok=True)
+
+    def build_headers(self) -> dict:
+        offset = self.size()
+        validator = self.load_meta().get("validator")
+        if offset == 0 or not validator:
+            return {}
+        return {"Range": f"bytes={offset}-", "If-Range": validator}
+
+    def build_request(self):
+        # urllib.request の import は重いため, ダウンロード時まで遅延させる
+        from urllib.request import Request
+        return Request(self.url, headers=self.build_headers())
+
+    def receive(self, res, chunk_size: int = 1024 * 1024, stream: bool = False) -> bytes:
+        # レスポンスを受信し, 全体を受信できた場合はその内容を返す
+        # stream=False の場合はメモリ上に受信し, 途中で切断された場合のみ受信済みの分を partial ファイルに書き出す
+        # stream=True の場合(動画など大きなメディア)は, 受信しながら partial ファイルに書き込む
+        if res.status == 206:
+            match = _CONTENT_RANGE_PATTERN.fullmatch(
+                res.headers.get("Content-Range", ""))
+            if match is None or int(match.group(1)) != self.size():
+                # 要求した位置と異なる範囲が返ってきた場合は最初から取り直す
+                self.discard()
+                raise IncompleteDownloadError(
+                    f"unexpected Content-Range: {self.url}")
+            total = None if match.group(3) == "*" else int(match.group(3))
+            meta = None
+        else:
+            # Range を送っていない, もしくは If-Range の検証で変更が検出された場合は全体が返る
+            length = res.headers.get("Content-Length")
+            total = int(length) if length is not None else None
+            meta = {"url": self.url, "validator": build_validator(
+                res.headers), "total": total}
+        if stream:
+            return self._receive_file(res, chunk_size, total, meta)
+        return self._receive_memory(res, chunk_size, total, meta)
+
+    def _receive_memory(self, res, chunk_size: int, total: int | None, meta: dict | None) -> bytes:
+        if meta is None:
+            # 続きから受信する場合は, 受信済みの分を読み込んでから追記する
+            meta = self.load_meta()
+            buffer = bytearray(self.size())
+            with self.part_path.open("rb") as f:
+                f.readinto(buffer)
+        else:
+            buffer = bytearray()
+        try:
+            while True:
+                chunk = res.read(chunk_size)
+                if not chunk:
+                    break
+                buffer += chunk
+        except BaseException:
+            self._save(buffer, meta)
+            raise
+        if total is not None and len(buffer) != total:
+            if len(buffer) > total:
+                self.discard()
+            else:
+                self._save(buffer, meta)
+            raise IncompleteDownloadError(
+                f"received {len(buffer)} of {total} bytes: {self.url}")
+        if self.part_path.exists():
+            self.discard()
+        # bytes への変換はコピーとなるため, bytearray のまま返す
+        return buffer
+
+    def _receive_file(self, res, chunk_size: int, total: int | None, meta: dict | None) -> bytes:
+        offset = 0
+        if meta is None:
+            offset = self.size()
+        else:
+            self.part_path.parent.mkdir(parents=True, exist_ok=True)
+            self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        with self.part_path.open("r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            while True:
+                chunk = res.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+        size = self.size()
+        if total is not None and size != total:
+            if size > total:
+                self.discard()
+            raise IncompleteDownloadError(
+                f"received {size} of {total} bytes: {self.url}")
+        data = self.part_path.read_bytes()
+        self.discard()
+        return data
+
+    def _save(self, buffer: bytearray, meta: dict) -> None:
+        # 続きから再開できるよう, 受信済みの分と検証用の値を書き出す
+        if not buffer:
+            return
+        self.part_path.parent.mkdir(parents=True, exist_ok=True)
+        self.part_path.write_bytes(buffer)
+        self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import base64
+import contextlib
+import io
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from src.clock import VirtualClock
+
+# 再生時に付け直す, もしくは再現できないヘッダー
+_SKIP_HEADERS = {"content-length", "transfer-encoding",
+                 "connection", "keep-alive", "content-encoding"}
+
+
+def build_key(url: str, query: dict | None = None) -> str:
+    # scheme を除いた URL とソートしたクエリで, 同じリクエストかどうかを判定する
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    params.update({key: str(value) for key, value in (query or {}).items()})
+    return f"{parts.netloc}{parts.path}?{urlencode(sorted(params.items()))}"
+
+
+class Cassette:
+    # 記録したリクエストとレスポンスの並び
+    # レスポンスのヘッダー・本文に加え, 記録開始からの経過時間(offset)と応答時間(elapsed)を保持する
+
+    def __init__(self, interactions: list = None) -> None:
+        self.interactions = list(interactions) if interactions is not None else []
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    @classmethod
+    def load(cls, path: Path) -> Cassette:
+        with path.open("r", encoding="utf-8") as f:
+            return cls(json.load(f)["interactions"])
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"interactions": self.interactions},
+                      f, ensure_ascii=False, indent=1)
+
+    def add(self, url: str, query: dict | None, status: int, headers, body: bytes,
+            elapsed: float = 0.0, offset: float = 0.0) -> dict:
+        interaction = {
+            "key": build_key(url, query),
+            "status": status,
+            "headers": [[key, value] for key, value in headers if key.lower() not in _SKIP_HEADERS],
+            "elapsed": round(elapsed, 3),
+            "offset": round(offset, 3),
+        }
+        try:
+            interaction["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            interaction["body_base64"] = base64.b64encode(body).decode("ascii")
+        self.interactions.append(interaction)
+        return interaction
+
+
+def interaction_body(interaction: dict) -> bytes:
+    if "body_base64" in interaction:
+        return base64.b64decode(interaction["body_base64"])
+    return interaction.get("body", "").encode("utf-8")
+
+
+class _RecordedResponse(io.BytesIO):
+    # 記録のために読み切った urlopen のレスポンスの代わり
+
+    def __init__(self, body: bytes, status: int, headers) -> None:
+        super().__init__(body)
+        self.status = status
+        self.headers = headers
+
+    def getcode(self) -> int:
+        return self.status
+
+
+class RecordingSession:
+    # requests.Session をラップし, TwitterApi の通信を記録する
+
+    def __init__(self, inner, recorder: Recorder) -> None:
+        self.inner = inner
+        self.recorder = recorder
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        res = self.inner.get(url, params=params, **kwargs)
+        self.recorder.cassette.add(url, params, res.status_code, res.headers.items(), res.content,
+                                   res.elapsed.total_seconds(), self.recorder.offset())
+        return res
+
+
+class Recorder:
+    # 実際の通信を記録する. 認証情報を含むリクエストヘッダーは記録しない
+
+    def __init__(self, cassette: Cassette = None) -> None:
+        self.cassette = cassette if cassette is not None else Cassette()
+        self._started_at = time.monotonic()
+
+    def offset(self) -> float:
+        return time.monotonic() - self._started_at
+
+    def session(self, inner) -> RecordingSession:
+        return RecordingSession(inner, self)
+
+    @contextlib.contextmanager
+    def patch_urlopen(self):
+        # ダウンロード(urllib.request.urlopen)の通信を記録する
+        import urllib.request
+        from urllib.error import HTTPError
+        original = urllib.request.urlopen
+
+        def urlopen(request, *args, **kwargs):
+            url = request.full_url if isinstance(
+                request, urllib.request.Request) else request
+            started_at = time.monotonic()
+            try:
+                with original(request, *args, **kwargs) as res:
+                    body = res.read()
+                    status, headers = res.status, res.headers
+            except HTTPError as e:
+                body = e.read()
+                self.cassette.add(url, None, e.code, e.headers.items(), body,
+                                  time.monotonic() - started_at, self.offset())
+                raise HTTPError(url, e.code, e.msg, e.headers, io.BytesIO(body))
+            self.cassette.add(url, None, status, headers.items(), body,
+                              time.monotonic() - started_at, self.offset())
+            return _RecordedResponse(body, status, headers)
+        urllib.request.urlopen = urlopen
+        try:
+            yield self
+        finally:
+            urllib.request.urlopen = original
+
+
+class ReplayServer:
+    # 記録したレスポンスを, 同じリクエストに対して記録した順に返すローカルの HTTP サーバー
+    # 各ホストは http://127.0.0.1:port/{host}/... として提供し, 本文中の URL もこのサーバーに書き換える
+    # clock を指定した場合, 記録した応答時間の分だけ仮想時刻を進める
+
+    def __init__(self, cassette: Cassette, clock: VirtualClock = None) -> None:
+        self.clock = clock
+        self._queues = {}
+        self._hosts = set()
+        for interaction in cassette.interactions:
+            self._queues.setdefault(
+                interaction["key"], deque()).append(interaction)
+            self._hosts.add(interaction["key"].split("/", 1)[0])
+        self._lock = threading.Lock()
+        # 記録にないリクエスト
+        self.unmatched = []
+        self.served = 0
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._build_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def url_for(self, host: str) -> str:
+        return f"{self.base_url}/{host}"
+
+    def rewrite(self, text: str) -> str:
+        for host in self._hosts:
+            text = text.replace(f"https://{host}", self.url_for(host))
+            # JSON 中で "/" がエスケープされている場合
+            text = text.replace(f"https:\\/\\/{host}",
+                                self.url_for(host).replace("/", "\\/"))
+        return text
+
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def start(self) -> ReplayServer:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> ReplayServer:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _next(self, key: str) -> dict | None:
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.unmatched.append(key)
+                return None
+            self.served += 1
+            return queue.popleft()
+
+    def _build_handler(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                key = build_key(f"http:/{self.path}")
+                interaction = replay._next(key)
+                if interaction is None:
+                    self._send(501, [], f"unmatched request: {key}".encode())
+                    return
+                if replay.clock is not None:
+                    replay.clock.advance(interaction["elapsed"])
+                body = interaction_body(interaction)
+                if "body" in interaction:
+                    body = replay.rewrite(interaction["body"]).encode("utf-8")
+                self._send(interaction["status"],
+                           interaction["headers"], body)
+
+            def _send(self, status: int, headers: list, body: bytes) -> None:
+                self.send_response(status)
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+        return Handler
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import random
+
+
+class AdaptiveInterval:
+    # 常駐モードのポーリング間隔を決める
+    # 新着がない間は backoff 倍ずつ max_interval まで間隔を伸ばし, 新着があれば base に戻す
+    # 複数台で同時にアクセスしないよう, 間隔には ±jitter の割合で揺らぎを加える
+
+    def __init__(self, base: float, max_interval: float, backoff: float = 2.0,
+                 jitter: float = 0.1, rand: random.Random = None) -> None:
+        self.base = base
+        self.max_interval = max(base, max_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.current = base
+        self._rand = rand if rand is not None else random.Random()
+
+    def next(self, found_new: bool) -> float:
+        if found_new:
+            self.current = self.base
+        else:
+            self.current = min(self.current * self.backoff, self.max_interval)
+        spread = self.current * self.jitter
+        return max(0.0, self.current + self._rand.uniform(-spread, spread))
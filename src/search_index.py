@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import datetime
+import json
+import re
+import sqlite3
+import unicodedata
+from pathlib import Path
+from typing import Iterable
+
+# 英数字は単語単位, それ以外(日本語など)は文字 bigram 単位で索引する
+_RUN_PATTERN = re.compile(r"[0-9a-z_]+|[^\s0-9a-z_]+")
+_WORD_PATTERN = re.compile(r"[0-9a-z_]+")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _runs(text: str) -> list[str]:
+    # 記号(句読点・絵文字など)で区切った文字の並び
+    result = []
+    for run in _RUN_PATTERN.findall(normalize(text)):
+        chars = "".join(
+            char if unicodedata.category(char)[0] in "LNM" else " " for char in run)
+        result.extend(chars.split())
+    return result
+
+
+def document_tokens(text: str) -> str:
+    # 文書側: 単語 + bigram. 1文字での検索にも前方一致で当たるよう, 並びの末尾の1文字も加える
+    tokens = []
+    for run in _runs(text):
+        if _WORD_PATTERN.fullmatch(run):
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return " ".join(tokens)
+
+
+def _quote(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def query_expression(term: str) -> list[str]:
+    # 検索語を FTS5 の式に変換する. 日本語は bigram の連続(フレーズ)として部分一致させる
+    result = []
+    for run in _runs(term):
+        if _WORD_PATTERN.fullmatch(run):
+            result.append(f"{_quote(run)}*")
+        elif len(run) == 1:
+            result.append(f"{_quote(run)}*")
+        else:
+            bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+            result.append(_quote(" ".join(bigrams)))
+    return result
+
+
+def build_match(query: str) -> str:
+    # 空白区切りの検索語を AND で結合する
+    # "#タグ" はハッシュタグ, "@名前" はユーザー名・スクリーンネームのみを対象とする
+    expressions = []
+    for term in query.split():
+        column = None
+        if term.startswith("#"):
+            column, term = "hashtag", term[1:]
+        elif term.startswith("@"):
+            column, term = "user", term[1:]
+        for expression in query_expression(term):
+            if column:
+                expression = f"{column} : {expression}"
+            expressions.append(expression)
+    return " AND ".join(expressions)
+
+
+def build_location(item: dict) -> str:
+    # プロパティから画像の保存場所(OUTPUT_DIR からの相対パス, もしくは S3 のキー)を求める
+    stem = item["partition_key"]
+    suffix = ".mp4" if item.get("media_type") in ["video", "animated_gif"] else ".png"
+    if item.get("s3_key"):
+        return f"s3:{item['s3_key']}"
+    if item.get("archive"):
+        return f"{item['archive']}#{stem}{suffix}"
+    created_at = datetime.datetime.fromisoformat(item["created_at"])
+    return f"yyyy={created_at.year}/mm={str(created_at.month).zfill(2)}/dd={str(created_at.day).zfill(2)}/{stem}{suffix}"
+
+
+def _from_dynamodb_json(value: dict):
+    # DynamoDB のエクスポート形式({"S": "..."} など)を通常の値に戻す
+    (kind, inner), = value.items()
+    if kind == "M":
+        return {k: _from_dynamodb_json(v) for k, v in inner.items()}
+    if kind == "L":
+        return [_from_dynamodb_json(v) for v in inner]
+    if kind == "NULL":
+        return None
+    return inner
+
+
+def load_table_export(path: Path) -> Iterable[dict]:
+    # DynamoDB の S3 エクスポート(DYNAMODB_JSON, 1行1アイテム)を読み込む
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield {key: _from_dynamodb_json(value) for key, value in record["Item"].items()}
+
+
+class SearchIndex:
+    # いいねしたツイートのテキスト・ユーザー名・ハッシュタグの全文検索インデックス(SQLite FTS5)
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # バックフィルの複数ワーカーから同時に書き込まれることがあるため, ロック待ちを長めにとる
+        self._conn = sqlite3.connect(str(path), timeout=30.0)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                partition_key TEXT UNIQUE NOT NULL,
+                location TEXT NOT NULL,
+                created_at TEXT,
+                text TEXT,
+                user_name TEXT,
+                user_screen_name TEXT,
+                hashtag TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+                text, user, hashtag, content='', tokenize='unicode61'
+            );
+        """)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> SearchIndex:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def add(self, item: dict) -> None:
+        with self._conn:
+            self._upsert(item)
+
+    def add_many(self, items: Iterable[dict]) -> int:
+        # 画像のプロパティ以外(リースなど)は対象外. 登録した件数を返す
+        count = 0
+        with self._conn:
+            for item in items:
+                if "created_at" not in item:
+                    continue
+                self._upsert(item)
+                count += 1
+        return count
+
+    def rebuild(self, items: Iterable[dict]) -> int:
+        with self._conn:
+            self._conn.execute("DELETE FROM items")
+            self._conn.execute(
+                "INSERT INTO items_fts(items_fts) VALUES('delete-all')")
+        return self.add_many(items)
+
+    def _upsert(self, item: dict) -> None:
+        row = self._conn.execute(
+            "SELECT id, text, user_name, user_screen_name, hashtag FROM items WHERE partition_key = ?",
+            (item["partition_key"],)).fetchone()
+        if row is not None:
+            # contentless テーブルからの削除には, 登録時と同じ値が必要
+            self._conn.execute(
+                "INSERT INTO items_fts(items_fts, rowid, text, user, hashtag) VALUES('delete', ?, ?, ?, ?)",
+                (row[0], document_tokens(row[1]), document_tokens(f"{row[2]} {row[3]}"), document_tokens(row[4])))
+            self._conn.execute("DELETE FROM items WHERE id = ?", (row[0],))
+        cursor = self._conn.execute(
+            "INSERT INTO items (partition_key, location, created_at, text, user_name, user_screen_name, hashtag)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (item["partition_key"], build_location(item), item.get("created_at"), item.get("text", ""),
+             item.get("user_name", ""), item.get("user_screen_name", ""), item.get("hashtag", "")))
+        self._conn.execute(
+            "INSERT INTO items_fts (rowid, text, user, hashtag) VALUES (?, ?, ?, ?)",
+            (cursor.lastrowid, document_tokens(item.get("text", "")),
+             document_tokens(
+                 f"{item.get('user_name', '')} {item.get('user_screen_name', '')}"),
+             document_tokens(item.get("hashtag", ""))))
+
+    def search(self, query: str, limit: int = 100) -> list[dict]:
+        # 新しいツイート順に返す
+        match = build_match(query)
+        if not match:
+            return []
+        rows = self._conn.execute(
+            "SELECT items.partition_key, items.location, items.created_at, items.text FROM items_fts"
+            " JOIN items ON items.id = items_fts.rowid"
+            " WHERE items_fts MATCH ? ORDER BY items.created_at DESC LIMIT ?",
+            (match, limit)).fetchall()
+        return [
+            {"partition_key": row[0], "location": row[1],
+                "created_at": row[2], "text": row[3]}
+            for row in rows
+        ]
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+import time
+from pathlib import Path
+
+
+class SecretCache:
+    # 秘密情報をTTL付きでキャッシュする
+    # path を指定した場合は所有者のみ読み書き可能なファイルにも保存し, 実行間で共有する
+    # path を指定しない場合はプロセス内のみのキャッシュとなる
+
+    def __init__(self, path: Path | None = None, ttl: int = 3600) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+
+    def get(self, key: str) -> str | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = self._read_file().get(key)
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+        self._memory[key] = entry
+        return entry["value"]
+
+    def put(self, key: str, value: str) -> None:
+        entry = {
+            "value": value,
+            "expires_at": time.time() + self.ttl,
+        }
+        self._memory[key] = entry
+        if self.path is not None:
+            entries = self._read_file()
+            entries[key] = entry
+            self._write_file(entries)
+
+    def invalidate(self, key: str) -> None:
+        self._memory.pop(key, None)
+        if self.path is not None:
+            entries = self._read_file()
+            if entries.pop(key, None) is not None:
+                self._write_file(entries)
+
+    def _read_file(self) -> dict:
+        if self.path is None or not self.path.exists():
+            return {}
+        # 他のユーザーから読み書きできる状態のファイルは信用しない
+        if os.name == "posix" and self.path.stat().st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            print(f"ignore secret cache with loose permissions: {self.path}")
+            return {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_file(self, entries: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
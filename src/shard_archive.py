@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import mmap
+import tarfile
+from pathlib import Path
+
+from src.file_lock import lock_exclusive
+
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+# tar の終端を表す2ブロック分のゼロ
+_END_OF_ARCHIVE = b"\0" * (_BLOCK_SIZE * 2)
+
+
+def build_index_path(tar_path: Path) -> Path:
+    return tar_path.with_name(f"{tar_path.name}.idx")
+
+
+class ShardArchive:
+    # 非圧縮の tar に画像を追記していくシャード
+    # 各メンバーのデータ位置は {name, offset, size} の JSON Lines として .idx に保持する
+
+    def __init__(self, tar_path: Path) -> None:
+        self.tar_path = tar_path
+        self.index_path = build_index_path(tar_path)
+
+    def append(self, name: str, data: bytes) -> tuple[int, int]:
+        # 追記したデータの (offset, size) を返す
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        padding = b"\0" * (-len(data) % _BLOCK_SIZE)
+        self.tar_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.tar_path.open("a+b") as f:
+            # 並列バックフィルの複数ワーカーが同じシャードに追記するため,
+            # 終端の検出からインデックスの追記までを排他ロックで直列化する
+            lock_exclusive(f)
+            end = self._find_end(f)
+            f.seek(end)
+            f.truncate()
+            f.write(header)
+            f.write(data)
+            f.write(padding)
+            f.write(_END_OF_ARCHIVE)
+            f.flush()
+            offset = end + len(header)
+            # tar への書き込み後にインデックスを追記する
+            # 途中で中断した場合は rebuild_index で tar から復元できる
+            with self.index_path.open("a", encoding="utf-8") as index:
+                index.write(json.dumps(
+                    {"name": name, "offset": offset, "size": len(data)}) + "\n")
+        return offset, len(data)
+
+    def _find_end(self, f) -> int:
+        # 終端ブロックの直前(次のメンバーを書き込む位置)を返す
+        f.seek(0, 2)
+        size = f.tell()
+        if size >= len(_END_OF_ARCHIVE):
+            f.seek(size - len(_END_OF_ARCHIVE))
+            if f.read(len(_END_OF_ARCHIVE)) == _END_OF_ARCHIVE:
+                return size - len(_END_OF_ARCHIVE)
+        return size
+
+    def rebuild_index(self) -> int:
+        # tar を走査してインデックスを作り直す. 登録したメンバー数を返す
+        count = 0
+        with self.tar_path.open("rb") as lock:
+            # 追記中のメンバーを読まないよう, 追記と排他にする
+            lock_exclusive(lock)
+            with tarfile.open(self.tar_path, "r") as tar, \
+                    self.index_path.open("w", encoding="utf-8") as f:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    f.write(json.dumps(
+                        {"name": member.name, "offset": member.offset_data, "size": member.size}) + "\n")
+                    count += 1
+        return count
+
+
+def load_index(tar_path: Path) -> dict:
+    result = {}
+    with build_index_path(tar_path).open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            # 同名のメンバーは後から追記したものを優先する
+            result[entry["name"]] = (entry["offset"], entry["size"])
+    return result
+
+
+class ShardArchiveReader:
+    # シャードをメモリマップし, インデックスからメンバーを直接読み出す
+
+    def __init__(self, tar_path: Path) -> None:
+        self.tar_path = tar_path
+        self.index = load_index(tar_path)
+        self._file = tar_path.open("rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> ShardArchiveReader:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def names(self) -> list[str]:
+        return list(self.index.keys())
+
+    def read(self, name: str) -> bytes:
+        offset, size = self.index[name]
+        return self._mmap[offset:offset + size]
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import io
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+
+
+def build_thumbnail_path(output_dir: Path, thumb_dir: Path, image_path: Path, format: str) -> Path:
+    # OUTPUT_DIR/yyyy=/mm=/dd=/{id}_{index}.png -> THUMB_DIR/yyyy=/mm=/dd=/{id}_{index}.webp
+    suffix = "jpg" if format.lower() == "jpeg" else format.lower()
+    return thumb_dir / image_path.relative_to(output_dir).with_suffix(f".{suffix}")
+
+
+def make_thumbnail(source: bytes | Path, dest: Path, size: int, format: str) -> Path:
+    # 別プロセスで実行するため, Pillow の import はここで行う
+    from PIL import Image
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        if img.mode not in ["RGB", "RGBA", "L"]:
+            img = img.convert("RGBA")
+        if format.lower() == "jpeg" and img.mode == "RGBA":
+            img = img.convert("RGB")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # 書き込み途中のファイルが残らないよう, 一時ファイル経由で置き換える
+        tmp_path = dest.with_name(f".{dest.name}.tmp")
+        img.save(tmp_path, format=format.upper())
+    tmp_path.replace(dest)
+    return dest
+
+
+class ThumbnailStage:
+    # ダウンロード直後のメモリ上の画像からサムネイルをプロセスプールで生成する
+    # 実行待ちが max_pending 件を超える場合はダウンロードを止めず生成を見送り, catch_up で後から生成する
+
+    def __init__(self, output_dir: Path, thumb_dir: Path, size: int = 256, format: str = "webp",
+                 workers: int = 2, max_pending: int = 8) -> None:
+        self.output_dir = output_dir
+        self.thumb_dir = thumb_dir
+        self.size = size
+        self.format = format
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def thumbnail_path(self, image_path: Path) -> Path:
+        return build_thumbnail_path(self.output_dir, self.thumb_dir, image_path, self.format)
+
+    def submit(self, image_path: Path, data: bytes | Path, block: bool = False) -> bool:
+        # 受け付けた場合True. 実行待ちが多すぎる場合, block=False なら見送りFalseを返す
+        while True:
+            with self._lock:
+                self._pending = {
+                    future for future in self._pending if not future.done()}
+                if len(self._pending) < self.max_pending:
+                    future = self._get_executor().submit(
+                        make_thumbnail, data, self.thumbnail_path(image_path), self.size, self.format)
+                    self._pending.add(future)
+                    break
+                if not block:
+                    print(f"skip thumbnail (busy) {image_path}")
+                    return False
+                pending = list(self._pending)
+            wait(pending, return_when=FIRST_COMPLETED)
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            print(f"thumbnail failed: {future.exception()}")
+
+    def catch_up(self) -> int:
+        # サムネイルが未生成の既存画像について生成する. 生成を依頼した件数を返す
+        count = 0
+        for image_path in sorted(self.output_dir.glob("yyyy=*/mm=*/dd=*/*.png")):
+            if self.thumbnail_path(image_path).exists():
+                continue
+            self.submit(image_path, image_path, block=True)
+            count += 1
+        return count
+
+    def close(self) -> None:
+        # 実行待ちのサムネイル生成が完了するまで待つ
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,30 +1,38 @@
 from __future__ import annotations
 
 import json
-import time
+import threading
+from typing import TYPE_CHECKING, Callable
 
-import requests
-from requests.exceptions import JSONDecodeError, Timeout
+from src.clock import SYSTEM_CLOCK, Clock, sleep_unless_stopped
+
+if TYPE_CHECKING:
+    # requests の import は重いため, 実際に通信するまで遅延させる
+    import requests
 
 
 def retry(func):
-    def wrapper(*args, **kwargs):
+    def wrapper(self, *args, **kwargs):
+        from requests.exceptions import Timeout
         max_retry_count = 3
         error = {}
         for idx in range(max_retry_count):
             try:
-                return func(*args, **kwargs)
+                return func(self, *args, **kwargs)
             except ServerErrorException as se:
                 # リトライ実施
-                time.sleep(15)
+                sleep_unless_stopped(
+                    self.clock, self.retry_wait, self.stop_event)
                 error[idx] = se.error
             except Timeout:
                 # リトライ実施
-                time.sleep(15)
+                sleep_unless_stopped(
+                    self.clock, self.retry_wait, self.stop_event)
                 error[idx] = "Time out error"
             except LateLimitException as le:
                 # リトライ実施
-                time.sleep(900)
+                sleep_unless_stopped(
+                    self.clock, self.rate_limit_wait, self.stop_event)
                 error[idx] = le.error
             except Exception as e:
                 # 上記以外の例外はそのまま投げる
@@ -36,9 +44,26 @@ def retry(func):
 
 
 class TwitterApi:
-    def __init__(self, bearer_token: str) -> None:
+    BASE_URL = "https://api.twitter.com"
+    # サーバーエラー・タイムアウト時, レート制限時のリトライまでの待ち時間(秒)
+    retry_wait = 15
+    rate_limit_wait = 900
+
+    def __init__(self, bearer_token: str, on_unauthorized: Callable[[], str] = None,
+                 session: requests.Session = None, base_url: str = BASE_URL,
+                 clock: Clock = SYSTEM_CLOCK, stop_event: threading.Event = None) -> None:
         self.bearer_token = bearer_token
         self.header = self._build_header()
+        # 401 が返ってきた際に新しい bearer_token を返す関数
+        self.on_unauthorized = on_unauthorized
+        # 指定した場合, コネクションを使いまわす(常駐モード向け)
+        self.session = session
+        # テストではローカルの再生用サーバーを指定する
+        self.base_url = base_url
+        # リトライ時の待ちに使う. シミュレーションでは仮想時刻の時計を指定する
+        self.clock = clock
+        # 指定した場合, set されるとリトライの待ちを打ち切り WaitInterrupted を送出する
+        self.stop_event = stop_event
 
     def _build_header(self) -> dict:
         return {
@@ -47,6 +72,7 @@ class TwitterApi:
 
     def _responce(self, res: requests.Response, params: dict) -> dict:
         # https://developer.twitter.com/en/support/twitter-api/error-troubleshooting
+        from requests.exceptions import JSONDecodeError
         if res.status_code in [200, 304]:
             return res.json()
         try:
@@ -65,16 +91,28 @@ class TwitterApi:
         raise ClientErrorException(res.status_code, error)
 
     def _requests_get(self, url: str, params: dict, timeout: int = 10) -> dict:
-        return self._responce(requests.get(url, headers=self.header, params=params, timeout=timeout), params)
+        import requests
+        http = self.session if self.session is not None else requests
+        res = http.get(url, headers=self.header,
+                       params=params, timeout=timeout)
+        if res.status_code == 401 and self.on_unauthorized is not None:
+            # bearer_token が失効している場合, 再取得して1回だけ再実行する
+            self.bearer_token = self.on_unauthorized()
+            self.header = self._build_header()
+            res = http.get(url, headers=self.header,
+                           params=params, timeout=timeout)
+        return self._responce(res, params)
 
     @ retry
-    def get_liked_tweets(self, id: str, next_token: str = None) -> list:
+    def get_liked_tweets(self, id: str, next_token: str = None, max_results: int = None) -> list:
         params = {
             "tweet.fields": "id",
         }
+        if max_results:
+            params["max_results"] = max_results
         if next_token:
             params["pagination_token"] = next_token
-        url = f"https://api.twitter.com/2/users/{id}/liked_tweets"
+        url = f"{self.base_url}/2/users/{id}/liked_tweets"
         return self._requests_get(url, params)
 
     @ retry
@@ -82,7 +120,7 @@ class TwitterApi:
         params = {
             "id": id,
         }
-        url = "https://api.twitter.com/1.1/statuses/show.json"
+        url = f"{self.base_url}/1.1/statuses/show.json"
         return self._requests_get(url, params)
 
 
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+class EnumerateLikedIdsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_path = Path(self.tmp_dir.name) / "queue.txt"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_ok(self):
+        # 初期化
+        api = mock.Mock()
+        api.get_liked_tweets.side_effect = [
+            {"data": [{"id": "1"}, {"id": "2"}], "meta": {"next_token": "next"}},
+            {"data": [{"id": "3"}], "meta": {}},
+        ]
+        from backfill import build_token_path, enumerate_liked_ids
+        # テストの実行
+        actual = enumerate_liked_ids(api, "LIKED_USER_ID", self.queue_path)
+        # アサーション
+        self.assertEqual(actual, 3)
+        self.assertEqual(self.queue_path.read_text(), "1\n2\n3\n")
+        self.assertFalse(build_token_path(self.queue_path).exists())
+        self.assertEqual(api.get_liked_tweets.call_args_list[0][0],
+                         ("LIKED_USER_ID", None, 100))
+        self.assertEqual(api.get_liked_tweets.call_args_list[1][0],
+                         ("LIKED_USER_ID", "next", 100))
+
+    def test_resume(self):
+        # 初期化
+        from backfill import build_token_path, enumerate_liked_ids
+        self.queue_path.write_text("1\n2\n")
+        build_token_path(self.queue_path).write_text("next")
+        api = mock.Mock()
+        api.get_liked_tweets.return_value = {
+            "data": [{"id": "3"}], "meta": {}}
+        # テストの実行
+        actual = enumerate_liked_ids(api, "LIKED_USER_ID", self.queue_path)
+        # アサーション
+        self.assertEqual(actual, 1)
+        self.assertEqual(self.queue_path.read_text(), "1\n2\n3\n")
+        self.assertEqual(api.get_liked_tweets.call_args[0][1], "next")
+
+
+class SplitQueueTest(unittest.TestCase):
+
+    def test_ok(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            queue_path = Path(tmp_dir) / "queue.txt"
+            queue_path.write_text("1\n2\n3\n2\n4\n5\n")
+            shard_dir = Path(tmp_dir) / "shards"
+            from backfill import read_shard, split_queue
+            # テストの実行
+            actual = split_queue(queue_path, shard_dir, 2)
+            # アサーション
+            self.assertEqual([path.name for path in actual], [
+                "shard-00000.txt", "shard-00001.txt", "shard-00002.txt"])
+            self.assertEqual(read_shard(actual[0]), ["1", "2"])
+            self.assertEqual(read_shard(actual[1]), ["3", "4"])
+            self.assertEqual(read_shard(actual[2]), ["5"])
+
+
+class RunWorkerTest(unittest.TestCase):
+
+    def test_ok(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            shard_dir = Path(tmp_dir)
+            (shard_dir / "shard-00000.txt").write_text("1\n2\n")
+            (shard_dir / "shard-00001.txt").write_text("3\n")
+            action = mock.Mock()
+            aws_resource = mock.Mock()
+            # shard-00001 は他のワーカーが取得済み
+            aws_resource.claim_lease.side_effect = [True, False]
+            from backfill import run_worker
+            # テストの実行
+            actual = run_worker(action, aws_resource, "LIKED_USER_ID",
+                                shard_dir, "owner_a")
+            # アサーション
+            self.assertEqual(actual, 1)
+            self.assertEqual(
+                [args[0][1] for args in action.process_tweet.call_args_list], ["1", "2"])
+            aws_resource.complete_lease.assert_called_once_with(
+                "lease#LIKED_USER_ID#shard-00000", "owner_a")
+            self.assertEqual(action.build_api.call_count, 1)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import datetime
 import os
+import tempfile
 from pathlib import Path
 import unittest
 from unittest import mock
@@ -43,20 +44,37 @@ class MakeOutputPathTest(unittest.TestCase):
         self.assertEqual(len(path_mock.call_args_list), 4)
 
 
+class BuildOutputPathTest(unittest.TestCase):
+
+    @mock.patch("run.Path.mkdir")
+    def test_ok(self, path_mock: mock.Mock):
+        # 初期化
+        created_at = datetime.datetime(2022, 3, 13, 1)
+        from run import build_output_path, make_output_path
+        # テストの実行
+        actual = build_output_path(Path.cwd(), created_at, "123456789", 0)
+        # アサーション
+        self.assertEqual(actual, make_output_path(
+            Path.cwd(), created_at, "123456789", 0))
+        self.assertEqual(len(path_mock.call_args_list), 4)
+
+
 class ToJstTimezoneTest(unittest.TestCase):
 
     def test_ok(self):
         # 初期化
         timestr = "Sat Feb 19 11:11:44 +0000 2022"
         format = "%a %b %d %H:%M:%S +0000 %Y"
-        expect = datetime.datetime(2022, 2, 19, 20, 11, 44).astimezone(
-            datetime.timezone(datetime.timedelta(hours=9)))
+        expect = datetime.datetime(2022, 2, 19, 20, 11, 44, tzinfo=datetime.timezone(
+            datetime.timedelta(hours=9)))
         from run import to_jst_timezone
         # テストの実行
         actual = to_jst_timezone(timestr, format)
         # アサーション
         self.assertEqual(str(actual.tzinfo), "UTC+09:00")
         self.assertEqual(actual, expect)
+        # 実行環境のタイムゾーンに依存せず, 9時間だけずれる
+        self.assertEqual(actual.hour, 20)
 
 
 class TwitterToJstTimezone(unittest.TestCase):
@@ -64,13 +82,37 @@ class TwitterToJstTimezone(unittest.TestCase):
     def test_ok(self):
         # 初期化
         timestr = "Sat Feb 19 11:11:44 +0000 2022"
-        expect = datetime.datetime(2022, 2, 19, 20, 11, 44).astimezone(
-            datetime.timezone(datetime.timedelta(hours=9)))
+        expect = datetime.datetime(2022, 2, 19, 20, 11, 44, tzinfo=datetime.timezone(
+            datetime.timedelta(hours=9)))
         from run import twitter_to_jst_timezone
         # テストの実行
         actual = twitter_to_jst_timezone(timestr)
         # アサーション
         self.assertEqual(actual, expect)
+        self.assertEqual(str(actual.tzinfo), "UTC+09:00")
+        self.assertEqual(actual.hour, 20)
+
+    def test_same_as_strptime(self):
+        # 初期化
+        from run import (TWITTER_DATE_FORMAT, to_jst_timezone,
+                         twitter_to_jst_timezone)
+        for timestr in ["Sat Feb 19 11:11:44 +0000 2022", "Thu Dec 31 15:00:00 +0000 2020",
+                        "Mon Jan 01 00:00:00 +0000 2018", "Tue Aug 11 23:59:59 +0000 2020"]:
+            # テストの実行
+            actual = twitter_to_jst_timezone(timestr)
+            # アサーション
+            self.assertEqual(actual, to_jst_timezone(
+                timestr, TWITTER_DATE_FORMAT))
+            self.assertEqual(actual.isoformat(), to_jst_timezone(
+                timestr, TWITTER_DATE_FORMAT).isoformat())
+
+    def test_fallback(self):
+        # 初期化
+        from run import twitter_to_jst_timezone
+        # テストの実行・アサーション
+        # 固定長でない書式は strptime で解析する
+        with self.assertRaises(ValueError):
+            twitter_to_jst_timezone("Sat Xxx 19 11:11:44 +0000 2022")
 
 
 class NowIsofTest(unittest.TestCase):
@@ -251,6 +293,44 @@ class AwsResourceTest(unittest.TestCase):
         # アサーション
         self.assertFalse(actual)
 
+    @mock_dynamodb
+    def test_has_property_item_known_keys(self):
+        # 初期化
+        from run import AwsResource
+        aws_resource = AwsResource(self.env_param)
+        # 仮想のDynamoDB テーブルを作成
+        dynamodb = boto3.resource('dynamodb')
+        table = self.create_table(
+            dynamodb, "PROPERTY_DB_NAME", "partition_key")
+        aws_resource.put_property(self.sample_property())
+        # テーブルから削除しても, 一度確認したキーはキャッシュから返す
+        table.delete_item(
+            Key={
+                "partition_key": "1293399653283557377_0"
+            }
+        )
+        # テストの実行
+        actual = aws_resource.has_property_item("1293399653283557377_0")
+        # アサーション
+        self.assertTrue(actual)
+
+    @mock_dynamodb
+    def test_scan_properties(self):
+        # 初期化
+        from run import AwsResource
+        aws_resource = AwsResource(self.env_param)
+        # 仮想のDynamoDB テーブルを作成
+        dynamodb = boto3.resource('dynamodb')
+        table = self.create_table(
+            dynamodb, "PROPERTY_DB_NAME", "partition_key")
+        table.put_item(
+            Item=self.sample_property()
+        )
+        # テストの実行
+        actual = list(aws_resource.scan_properties())
+        # アサーション
+        self.assertEqual(actual, [self.sample_property()])
+
     @mock_dynamodb
     def test_get_pagetoken(self):
         # 初期化
@@ -292,6 +372,60 @@ class AwsResourceTest(unittest.TestCase):
         )
         self.assertEqual(actual["Item"], self.sample_pagetoken())
 
+    @mock_dynamodb
+    def test_claim_lease(self):
+        # 初期化
+        from run import AwsResource
+        aws_resource = AwsResource(self.env_param)
+        # 仮想のDynamoDB テーブルを作成
+        dynamodb = boto3.resource('dynamodb')
+        self.create_table(dynamodb, "PROPERTY_DB_NAME", "partition_key")
+        # テストの実行
+        first = aws_resource.claim_lease("lease#shard-00000", "owner_a", 60)
+        other = aws_resource.claim_lease("lease#shard-00000", "owner_b", 60)
+        renew = aws_resource.claim_lease("lease#shard-00000", "owner_a", 60)
+        # アサーション
+        self.assertTrue(first)
+        self.assertFalse(other)
+        self.assertTrue(renew)
+
+    @mock_dynamodb
+    def test_claim_lease_expired(self):
+        # 初期化
+        from run import AwsResource
+        aws_resource = AwsResource(self.env_param)
+        # 仮想のDynamoDB テーブルを作成
+        dynamodb = boto3.resource('dynamodb')
+        self.create_table(dynamodb, "PROPERTY_DB_NAME", "partition_key")
+        aws_resource.claim_lease("lease#shard-00000", "owner_a", -1)
+        # テストの実行
+        actual = aws_resource.claim_lease("lease#shard-00000", "owner_b", 60)
+        # アサーション
+        self.assertTrue(actual)
+
+    @mock_dynamodb
+    def test_complete_lease(self):
+        # 初期化
+        from run import AwsResource
+        aws_resource = AwsResource(self.env_param)
+        # 仮想のDynamoDB テーブルを作成
+        dynamodb = boto3.resource('dynamodb')
+        table = self.create_table(
+            dynamodb, "PROPERTY_DB_NAME", "partition_key")
+        aws_resource.claim_lease("lease#shard-00000", "owner_a", -1)
+        # テストの実行
+        aws_resource.complete_lease("lease#shard-00000", "owner_a")
+        # アサーション
+        actual = table.get_item(
+            Key={
+                "partition_key": "lease#shard-00000"
+            }
+        )
+        self.assertEqual(actual["Item"]["status"], "done")
+        # 完了済みのリースは期限切れでも取得できない
+        self.assertFalse(aws_resource.claim_lease(
+            "lease#shard-00000", "owner_b", 60))
+
     def create_table(self, dynamodb: boto3.resource, table_name: str, partition_key: str) -> boto3.resources.factory.dynamodb.Table:
         return dynamodb.create_table(
             TableName=table_name,
@@ -331,3 +465,592 @@ class AwsResourceTest(unittest.TestCase):
             "page_token": "7140dibdnow9c7btw452upxk1q3s65hih3b8ebx3hoge",
             "timestamp": "2022-03-18T15:51:13.737285+09:00"
         }
+
+
+class AwsResourceLazyTest(unittest.TestCase):
+
+    def test_init_does_not_build_clients(self):
+        # 初期化
+        from run import AwsResource
+        session = mock.Mock()
+        # テストの実行
+        aws_resource = AwsResource(mock.Mock(), session)
+        # アサーション
+        self.assertEqual(session.client.call_count, 0)
+        self.assertEqual(session.resource.call_count, 0)
+        aws_resource.ssm_client
+        aws_resource.ssm_client
+        self.assertEqual(session.client.call_count, 1)
+        self.assertEqual(session.resource.call_count, 0)
+
+
+class ActionProbeTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=True,
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_nothing_new(self):
+        # 初期化
+        from run import Action
+        session = mock.Mock()
+        action = Action(self.env_param, self.output_dir, session)
+        (self.output_dir / ".latest_liked_id_LIKED_USER_ID").write_text("3")
+        api = mock.Mock()
+        api.get_liked_tweets.return_value = {
+            "data": [{"id": "3"}, {"id": "2"}], "meta": {"next_token": "next"}}
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api):
+            action._service()
+        # アサーション
+        self.assertEqual(api.get_liked_tweets.call_count, 1)
+        self.assertEqual(api.get_statuses_show.call_count, 0)
+        self.assertEqual(session.resource.call_count, 0)
+
+    def test_new(self):
+        # 初期化
+        from run import Action
+        session = mock.Mock()
+        action = Action(self.env_param, self.output_dir, session)
+        (self.output_dir / ".latest_liked_id_LIKED_USER_ID").write_text("2")
+        api = mock.Mock()
+        api.get_liked_tweets.return_value = {
+            "data": [{"id": "3"}], "meta": {"next_token": "next"}}
+        api.get_statuses_show.return_value = {"id_str": "3"}
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api):
+            action._service()
+        # アサーション
+        # 先頭ページは判定に利用したものを再利用する
+        self.assertEqual(api.get_liked_tweets.call_count, 1)
+        self.assertEqual(api.get_statuses_show.call_args[0][0], "3")
+        self.assertEqual(
+            (self.output_dir / ".latest_liked_id_LIKED_USER_ID").read_text(), "3")
+
+
+class ActionBearerTokenTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=True,
+            SECRET_CACHE_PATH=str(Path(self.tmp_dir.name) / "secret.json"),
+        )
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_cached_across_runs(self):
+        # 初期化
+        from run import Action, AwsResource
+        with mock.patch.object(AwsResource, "get_value_from_ssm", return_value="token") as ssm_mock:
+            # テストの実行
+            first = Action(self.env_param, Path.cwd(), mock.Mock()).build_api()
+            second = Action(self.env_param, Path.cwd(), mock.Mock()).build_api()
+        # アサーション
+        self.assertEqual(first.bearer_token, "token")
+        self.assertEqual(second.bearer_token, "token")
+        self.assertEqual(ssm_mock.call_count, 1)
+
+    def test_refresh_on_unauthorized(self):
+        # 初期化
+        from run import Action, AwsResource
+        with mock.patch.object(AwsResource, "get_value_from_ssm", side_effect=["old", "new"]) as ssm_mock:
+            api = Action(self.env_param, Path.cwd(), mock.Mock()).build_api()
+            # テストの実行
+            actual = api.on_unauthorized()
+            # アサーション
+            self.assertEqual(actual, "new")
+            self.assertEqual(ssm_mock.call_count, 2)
+            self.assertEqual(
+                Action(self.env_param, Path.cwd(), mock.Mock()).build_api().bearer_token, "new")
+
+
+class ActionServeTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=False,
+        )
+
+    @mock.patch("signal.signal")
+    def test_serve(self, signal_mock: mock.Mock):
+        # 初期化
+        from run import Action
+        from src.scheduler import AdaptiveInterval
+        action = Action(self.env_param, Path.cwd(), mock.Mock())
+        results = [True, Exception("error"), False]
+
+        def scan():
+            result = results.pop(0)
+            if not results:
+                action.stop()
+            if isinstance(result, Exception):
+                raise result
+            return result
+        interval = mock.Mock(spec=AdaptiveInterval)
+        interval.next.return_value = 0
+        # テストの実行
+        with mock.patch.object(Action, "build_api") as build_api_mock, \
+                mock.patch.object(Action, "__call__", side_effect=scan):
+            action.serve(interval)
+        # アサーション
+        # API クライアントは1度だけ構築し, 走査をまたいで使いまわす
+        self.assertEqual(build_api_mock.call_count, 1)
+        self.assertEqual(
+            [args[0][0] for args in interval.next.call_args_list], [True, False])
+        self.assertEqual(signal_mock.call_count, 2)
+
+    @mock.patch("signal.signal")
+    def test_serve_from_latest(self, signal_mock: mock.Mock):
+        # 初期化
+        from run import Action
+        from src.scheduler import AdaptiveInterval
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        action = Action(self.env_param, Path(tmp_dir.name), mock.Mock())
+        action._aws_resource = mock.Mock()
+        action._aws_resource.get_pagetoken.return_value = "saved"
+        api = mock.Mock()
+        latest = {"data": [{"id": "9"}], "meta": {}}
+        api.get_liked_tweets.return_value = latest
+        scans = []
+
+        def scan(api, page_token, ids):
+            scans.append((page_token, ids))
+            if len(scans) == 2:
+                action.stop()
+            return False
+        interval = mock.Mock(spec=AdaptiveInterval)
+        interval.next.return_value = 0
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api), \
+                mock.patch.object(Action, "_scan", side_effect=scan):
+            action.serve(interval)
+        # アサーション
+        # PAGETOKE_RESET=False でも, 2回目以降は最新のいいねから走査して新着を取得する
+        self.assertEqual(scans, [("saved", None), (None, latest)])
+        self.assertEqual(action._aws_resource.get_pagetoken.call_count, 1)
+
+    def test_stop_saves_pagetoken(self):
+        # 初期化
+        from run import Action
+        action = Action(self.env_param, Path.cwd(), mock.Mock())
+        action._aws_resource = mock.Mock()
+        action._aws_resource.get_pagetoken.return_value = "current"
+        api = mock.Mock()
+        api.get_liked_tweets.return_value = {
+            "data": [{"id": "1"}, {"id": "2"}], "meta": {"next_token": "next"}}
+
+        def fetch(api, tweet_id):
+            action.stop()
+            return None
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api), \
+                mock.patch.object(Action, "fetch_media_tweet", side_effect=fetch) as fetch_mock:
+            actual = action._service()
+        # アサーション
+        self.assertFalse(actual)
+        self.assertEqual(fetch_mock.call_count, 1)
+        action._aws_resource.put_pagetoken.assert_called_once_with("current")
+
+    def test_stop_during_retry_wait(self):
+        # 初期化
+        from urllib.error import HTTPError
+        from run import Action
+        action = Action(self.env_param, Path.cwd(), mock.Mock())
+        action._aws_resource = mock.Mock()
+        action._aws_resource.get_pagetoken.return_value = "current"
+        action._aws_resource.has_property_item.return_value = False
+        action._output_sink = mock.Mock()
+        api = mock.Mock()
+        api.get_liked_tweets.return_value = {
+            "data": [{"id": "1"}], "meta": {"next_token": "next"}}
+        api.get_statuses_show.return_value = {
+            "id_str": "1", "extended_entities": {"media": [
+                {"type": "photo", "media_url_https": "https://pbs.twimg.com/media/a.jpg"}]}}
+
+        def urlopen(*args, **kwargs):
+            # 500 のリトライ待ちの間に SIGTERM を受けた
+            action.stop()
+            raise HTTPError("https://pbs.twimg.com/media/a", 500,
+                            "Internal Server Error", {}, None)
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api), \
+                mock.patch("urllib.request.urlopen", side_effect=urlopen) as urlopen_mock:
+            actual = action._service()
+        # アサーション
+        # 30秒の待ちを打ち切り, 現在のページから再開できるよう保存して終了する
+        self.assertFalse(actual)
+        self.assertEqual(urlopen_mock.call_count, 1)
+        self.assertEqual(action._output_sink.write.call_count, 0)
+        action._aws_resource.put_pagetoken.assert_called_once_with("current")
+
+
+class ExtractMediaWorkItemsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tweet_infos = [
+            {"id_str": "1", "extended_entities": {"media": [
+                {"type": "photo", "media_url_https": "https://pbs.twimg.com/media/a.jpg"},
+                {"type": "video", "media_url_https": "https://pbs.twimg.com/media/b.jpg",
+                 "video_info": {"variants": [
+                     {"content_type": "application/x-mpegURL",
+                         "url": "https://video.twimg.com/b.m3u8"},
+                     {"content_type": "video/mp4", "bitrate": 832000,
+                         "url": "https://video.twimg.com/b_low.mp4"},
+                     {"content_type": "video/mp4", "bitrate": 2176000,
+                         "url": "https://video.twimg.com/b_high.mp4"},
+                 ]}},
+            ]}},
+            {"id_str": "2", "extended_entities": {"media": [
+                {"type": "animated_gif", "media_url_https": "https://pbs.twimg.com/media/c.jpg",
+                 "video_info": {"variants": [
+                     {"content_type": "video/mp4", "bitrate": 0,
+                         "url": "https://video.twimg.com/c.mp4"},
+                 ]}},
+            ]}},
+        ]
+
+    def test_photo_only(self):
+        from run import extract_media_work_items
+        actual = extract_media_work_items(self.tweet_infos)
+        self.assertEqual([item.stem for item in actual], ["1_0"])
+        self.assertEqual(actual[0].suffix, ".png")
+
+    def test_include_video(self):
+        from run import extract_media_work_items
+        actual = extract_media_work_items(self.tweet_infos, True)
+        self.assertEqual([item.stem for item in actual], ["1_0", "1_1", "2_0"])
+        self.assertEqual(actual[1].url, "https://video.twimg.com/b_high.mp4")
+        self.assertEqual(actual[1].suffix, ".mp4")
+        self.assertEqual(actual[2].media_type, "animated_gif")
+
+
+class ActionDownloadWorkItemsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=False,
+        )
+
+    @mock.patch("time.sleep")
+    def test_skip_tweets_without_media(self, sleep_mock: mock.Mock):
+        # 初期化
+        import run
+        from run import Action
+        from src.clock import SYSTEM_CLOCK
+        action = Action(self.env_param, Path.cwd(), mock.Mock())
+        action._aws_resource = mock.Mock()
+        action._aws_resource.get_pagetoken.return_value = None
+        action._aws_resource.has_property_item.return_value = False
+        action._output_sink = mock.Mock()
+        action._output_sink.write.return_value = {"write_time": "now"}
+        api = mock.Mock()
+        api.get_liked_tweets.side_effect = [
+            {"data": [{"id": "1"}, {"id": "2"}], "meta": {"next_token": "next"}},
+            {"meta": {}},
+        ]
+        api.get_statuses_show.side_effect = [
+            {"id_str": "1"},
+            {"id_str": "2", "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+             "text": "text", "user": {"name": "name", "screen_name": "screen_name"},
+             "entities": {"hashtags": []},
+             "extended_entities": {"media": [
+                 {"type": "photo", "media_url_https": "https://pbs.twimg.com/media/a.jpg"}]}},
+        ]
+        # テストの実行
+        with mock.patch.object(Action, "build_api", return_value=api), \
+                mock.patch("run.download_img", return_value=b"img") as download_mock, \
+                mock.patch("run.build_tweet_property", wraps=run.build_tweet_property) as property_mock:
+            actual = action._service()
+        # アサーション
+        self.assertTrue(actual)
+        download_mock.assert_called_once_with(
+            "https://pbs.twimg.com/media/a.jpg", Path.cwd() / ".partial", SYSTEM_CLOCK, action._stop_event)
+        self.assertEqual(property_mock.call_count, 1)
+        self.assertEqual(action._output_sink.write.call_args[0][1:], (
+            "2", 0, b"img", ".png"))
+        item = action._aws_resource.put_property.call_args[1]["item"]
+        self.assertEqual(item["partition_key"], "2_0")
+        self.assertEqual(item["write_time"], "now")
+        self.assertNotIn("media_type", item)
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.partial_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def response(self, status: int, chunks: list, headers: dict) -> mock.MagicMock:
+        res = mock.MagicMock()
+        res.__enter__.return_value = res
+        res.status = status
+        res.headers = headers
+        res.read.side_effect = chunks
+        return res
+
+    @mock.patch("time.sleep")
+    def test_resume(self, sleep_mock: mock.Mock):
+        # 初期化
+        import socket
+        from run import download
+        first = self.response(
+            200, [b"0123", socket.timeout()], {"Content-Length": "10", "ETag": '"v1"'})
+        second = self.response(
+            206, [b"456789", b""], {"Content-Range": "bytes 4-9/10"})
+        # テストの実行
+        with mock.patch("urllib.request.urlopen", side_effect=[first, second]) as urlopen_mock:
+            actual = download("https://video.twimg.com/a.mp4",
+                              partial_dir=self.partial_dir)
+        # アサーション
+        self.assertEqual(actual, b"0123456789")
+        request = urlopen_mock.call_args_list[1][0][0]
+        self.assertEqual(request.get_header("Range"), "bytes=4-")
+        self.assertEqual(request.get_header("If-range"), '"v1"')
+        self.assertEqual(sleep_mock.call_count, 1)
+
+    @mock.patch("time.sleep")
+    def test_not_found(self, sleep_mock: mock.Mock):
+        # 初期化
+        from urllib.error import HTTPError
+        from run import download
+        # テストの実行
+        with mock.patch("urllib.request.urlopen", side_effect=HTTPError(
+                "https://video.twimg.com/a.mp4", 404, "Not Found", {}, None)):
+            actual = download("https://video.twimg.com/a.mp4")
+        # アサーション
+        self.assertIsNone(actual)
+        self.assertEqual(sleep_mock.call_count, 0)
+
+
+class ActionNegativeCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=False,
+            NEGATIVE_CACHE_PATH=str(Path(self.tmp_dir.name) / "negative.json"),
+        )
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_deleted_tweet(self):
+        # 初期化
+        from run import Action
+        from src.twitter_api import DoseNotExistException
+        api = mock.Mock()
+        api.get_statuses_show.side_effect = DoseNotExistException(
+            404, {"errors": [{"code": 144}]})
+        # テストの実行
+        first = Action(self.env_param, Path.cwd(), mock.Mock()
+                       ).fetch_media_tweet(api, "1")
+        second = Action(self.env_param, Path.cwd(), mock.Mock()
+                        ).fetch_media_tweet(api, "1")
+        # アサーション
+        # 次回以降の実行では API を呼ばない
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(api.get_statuses_show.call_count, 1)
+
+    @mock.patch("time.sleep")
+    def test_not_found_media(self, sleep_mock: mock.Mock):
+        # 初期化
+        from run import Action, MediaWorkItem
+        action = Action(self.env_param, Path.cwd(), mock.Mock())
+        action._aws_resource = mock.Mock()
+        action._aws_resource.has_property_item.return_value = False
+        work_items = [MediaWorkItem(
+            {"id_str": "1"}, 0, "photo", "https://pbs.twimg.com/media/a.jpg", ".png")]
+        # テストの実行
+        with mock.patch("run.download_img", return_value=None) as download_mock:
+            first = action._download_work_items(work_items, Path.cwd())
+            second = action._download_work_items(work_items, Path.cwd())
+        # アサーション
+        self.assertTrue(first)
+        self.assertTrue(second)
+        self.assertEqual(download_mock.call_count, 1)
+        self.assertEqual(action._aws_resource.has_property_item.call_count, 1)
+
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.environ = {
+            "BEARER_TOKEN": "BEARER_TOKEN",
+            "LIKED_USER_ID": "LIKED_USER_ID",
+            "PROPERTY_DB_NAME": "PROPERTY_DB_NAME",
+            "PAGE_TOKE_DB_NAME": "PAGE_TOKE_DB_NAME",
+            "DIR_NAME": self.tmp_dir.name,
+            "PAGETOKE_RESET": "False",
+        }
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_daemon_mode(self):
+        # 初期化
+        from run import Action, main
+        from src.scheduler import AdaptiveInterval
+        environ = {**self.environ, "DAEMON_MODE": "True",
+                   "POLL_INTERVAL": "60", "POLL_MAX_INTERVAL": "600"}
+        # テストの実行
+        with mock.patch.dict(os.environ, environ, clear=True), \
+                mock.patch.object(Action, "serve") as serve_mock:
+            main()
+        # アサーション
+        interval = serve_mock.call_args[0][0]
+        self.assertIsInstance(interval, AdaptiveInterval)
+        self.assertEqual(interval.base, 60.0)
+        self.assertEqual(interval.max_interval, 600.0)
+
+    def test_once(self):
+        # 初期化
+        from run import Action, main
+        # テストの実行
+        with mock.patch.dict(os.environ, self.environ, clear=True), \
+                mock.patch.object(Action, "__call__") as call_mock, \
+                mock.patch.object(Action, "close") as close_mock:
+            main()
+        # アサーション
+        self.assertEqual(call_mock.call_count, 1)
+        self.assertEqual(close_mock.call_count, 1)
+
+
+def build_storm_cassette(pages: int, per_page: int, storm_every: int):
+    # いいね pages ページ分(1ページ per_page 件, 各1画像)の記録を合成する
+    # statuses/show と画像のダウンロードは storm_every 件毎に 429 を挟む
+    import json
+    from src.replay import Cassette
+    cassette = Cassette()
+    json_headers = [("Content-Type", "application/json; charset=utf-8")]
+    liked_url = "https://api.twitter.com/2/users/LIKED_USER_ID/liked_tweets"
+    show_url = "https://api.twitter.com/1.1/statuses/show.json"
+    count = 0
+    for page in range(pages + 1):
+        query = {"tweet.fields": "id"}
+        if page > 0:
+            query["pagination_token"] = f"p{page}"
+        if page == pages:
+            # 最終ページの次は空のページが返る
+            cassette.add(liked_url, query, 200, json_headers,
+                         b'{"meta": {"result_count": 0}}', 0.2)
+            break
+        ids = [str(page * per_page + i + 1) for i in range(per_page)]
+        body = {"data": [{"id": id} for id in ids],
+                "meta": {"result_count": per_page, "next_token": f"p{page + 1}"}}
+        cassette.add(liked_url, query, 200, json_headers,
+                     json.dumps(body).encode(), 0.2)
+        for id in ids:
+            count += 1
+            media_url = f"https://pbs.twimg.com/media/{id}"
+            if count % storm_every == 0:
+                cassette.add(show_url, {"id": id}, 429, json_headers,
+                             b'{"errors": [{"code": 88}]}', 0.1)
+                cassette.add(f"{media_url}?format=png&name=large", None, 429, [], b"", 0.1)
+            tweet = {"id_str": id, "created_at": "Wed Oct 10 20:19:24 +0000 2018", "text": f"tweet {id}",
+                     "user": {"name": "name", "screen_name": "screen_name"}, "entities": {"hashtags": []},
+                     "extended_entities": {"media": [{"type": "photo", "media_url_https": f"{media_url}.jpg"}]}}
+            cassette.add(show_url, {"id": id}, 200, json_headers,
+                         json.dumps(tweet).encode(), 0.1)
+            cassette.add(f"{media_url}?format=png&name=large", None, 200,
+                         [("Content-Type", "image/png")], b"\x89PNG" + id.encode(), 0.5)
+    return cassette
+
+
+class ActionReplayTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from run import EnvironParamaters
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env_param = EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=False,
+        )
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_rate_limit_storm(self):
+        # 初期化
+        import time
+        from run import Action
+        from src.clock import VirtualClock
+        from src.replay import ReplayServer
+        from src.twitter_api import TwitterApi
+        pages, per_page, storm_every = 10, 20, 7
+        clock = VirtualClock()
+        action = Action(self.env_param, Path(
+            self.tmp_dir.name), mock.Mock(), clock=clock)
+        action._aws_resource = mock.Mock()
+        action._aws_resource.has_property_item.return_value = False
+        action._output_sink = mock.Mock()
+        action._output_sink.write.return_value = {}
+        started_at = time.monotonic()
+        # テストの実行
+        with ReplayServer(build_storm_cassette(pages, per_page, storm_every), clock) as server:
+            api = TwitterApi(
+                "sample", base_url=server.url_for("api.twitter.com"), clock=clock)
+            actual = action._scan(api, None, None)
+        # アサーション
+        total = pages * per_page
+        storms = total // storm_every
+        self.assertTrue(actual)
+        self.assertEqual(server.unmatched, [])
+        self.assertEqual(server.remaining(), 0)
+        self.assertEqual(action._output_sink.write.call_count, total)
+        self.assertEqual(
+            action._output_sink.write.call_args[0][3], b"\x89PNG" + str(total).encode())
+        # 仮想時刻: 429 の待ち(API 900秒, 画像 30秒) + 1画像毎の3秒 + 記録した応答時間
+        self.assertEqual(clock.sleeps.count(900), storms)
+        self.assertEqual(clock.sleeps.count(30), storms)
+        expected = storms * (900 + 30 + 0.2) + total * (3 + 0.6) + (pages + 1) * 0.2
+        self.assertAlmostEqual(clock.now(), expected, places=3)
+        # 実時間では数秒で終わる
+        self.assertLess(time.monotonic() - started_at, 30)
@@ -0,0 +1,83 @@
+import threading
+import unittest
+from unittest import mock
+
+from src.clock import (Clock, SystemClock, VirtualClock, WaitInterrupted,
+                       sleep_unless_stopped)
+
+
+class SystemClockTest(unittest.TestCase):
+
+    @mock.patch("time.sleep")
+    def test_sleep(self, sleep_mock: mock.Mock):
+        # time.sleep の差し替えが有効
+        SystemClock().sleep(15)
+        sleep_mock.assert_called_once_with(15)
+
+    def test_wait(self):
+        # 初期化
+        event = threading.Event()
+        event.set()
+        # テストの実行・アサーション
+        self.assertTrue(SystemClock().wait(event, 10))
+
+
+class VirtualClockTest(unittest.TestCase):
+
+    def test_sleep(self):
+        # 初期化
+        clock = VirtualClock(100.0)
+        # テストの実行
+        clock.sleep(900)
+        clock.advance(0.5)
+        # アサーション
+        self.assertEqual(clock.now(), 1000.5)
+        self.assertEqual(clock.sleeps, [900])
+
+    def test_wait(self):
+        # 初期化
+        clock = VirtualClock()
+        event = threading.Event()
+        # テストの実行
+        not_set = clock.wait(event, 300)
+        event.set()
+        is_set = clock.wait(event, 300)
+        # アサーション
+        # 停止要求があれば時刻を進めない
+        self.assertFalse(not_set)
+        self.assertTrue(is_set)
+        self.assertEqual(clock.now(), 300)
+        self.assertEqual(clock.sleeps, [300])
+
+
+class SleepUnlessStoppedTest(unittest.TestCase):
+
+    def test_not_stopped(self):
+        # 初期化
+        clock = VirtualClock()
+        # テストの実行
+        sleep_unless_stopped(clock, 900, threading.Event())
+        sleep_unless_stopped(clock, 15)
+        # アサーション
+        self.assertEqual(clock.sleeps, [900, 15])
+
+    def test_stopped(self):
+        # 初期化
+        clock = VirtualClock()
+        event = threading.Event()
+        event.set()
+        # テストの実行
+        with self.assertRaises(WaitInterrupted):
+            sleep_unless_stopped(clock, 900, event)
+        # アサーション
+        self.assertEqual(clock.now(), 0)
+
+
+class ClockProtocolTest(unittest.TestCase):
+
+    def test_implementations(self):
+        # どちらの時計も注入先の型(Clock)の要件を満たす
+        clocks: list[Clock] = [SystemClock(), VirtualClock()]
+        for clock in clocks:
+            for name in ["now", "sleep", "wait"]:
+                self.assertTrue(callable(getattr(clock, name)))
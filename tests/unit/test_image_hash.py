@@ -0,0 +1,160 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    # requirements_image.txt をインストールしていない場合
+    raise unittest.SkipTest("numpy and Pillow are not installed")
+
+from src.image_hash import (MAX_DUPLICATE_DISTANCE, HashIndex, _iter_matches,
+                            compute_hashes, hamming_distance, hash_files)
+
+
+def save_image(path: Path, array: np.ndarray) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(array.astype(np.uint8)).save(path)
+    return path
+
+
+def sample_array(seed: int, size: int = 256) -> np.ndarray:
+    rand = np.random.default_rng(seed)
+    # 滑らかな模様にするため, 低解像度の乱数を拡大する
+    low = rand.integers(0, 256, (8, 8, 3))
+    return np.kron(low, np.ones((size // 8, size // 8, 1)))
+
+
+class ComputeHashesTest(unittest.TestCase):
+
+    def test_shape(self):
+        # 初期化
+        large = np.random.default_rng(0).random((5, 32, 32)).astype(np.float32)
+        small = np.random.default_rng(1).random((5, 8, 9)).astype(np.float32)
+        # テストの実行
+        actual = compute_hashes(large, small)
+        # アサーション
+        self.assertEqual(actual.shape, (5, 3))
+        self.assertEqual(actual.dtype, np.uint64)
+
+    def test_resized_copy_is_near(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            original = save_image(Path(tmp_dir) / "a.png", sample_array(0))
+            resized = Path(tmp_dir) / "b.png"
+            Image.open(original).resize((128, 128)).save(resized)
+            other = save_image(Path(tmp_dir) / "c.png", sample_array(1))
+            # テストの実行
+            _, hashes = hash_files([original, resized, other])
+            # アサーション
+            phash = hashes[:, 2]
+            near, far = hamming_distance(phash[1:], int(phash[0]))
+            self.assertLessEqual(near, 4)
+            self.assertGreater(far, 10)
+
+
+class HammingDistanceTest(unittest.TestCase):
+
+    def test_ok(self):
+        # 初期化
+        hashes = np.array([0, 1, 0b1011, 2**64 - 1], dtype=np.uint64)
+        # テストの実行
+        actual = hamming_distance(hashes, 0)
+        # アサーション
+        self.assertEqual(actual.tolist(), [0, 1, 3, 64])
+
+
+class HashIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_update_incremental(self):
+        # 初期化
+        save_image(self.output_dir / "yyyy=2022" / "mm=03" /
+                   "dd=13" / "1_0.png", sample_array(0))
+        index = HashIndex()
+        index.update(self.output_dir)
+        save_image(self.output_dir / "yyyy=2022" / "mm=03" /
+                   "dd=14" / "2_0.png", sample_array(1))
+        # テストの実行
+        actual = index.update(self.output_dir)
+        # アサーション
+        self.assertEqual(actual, 1)
+        self.assertEqual(index.keys, [
+            "yyyy=2022/mm=03/dd=13/1_0.png", "yyyy=2022/mm=03/dd=14/2_0.png"])
+
+    def test_save_load(self):
+        # 初期化
+        index = HashIndex(["a", "b"], np.array(
+            [[1, 2, 3], [4, 5, 6]], dtype=np.uint64))
+        path = self.output_dir / "index.npz"
+        # テストの実行
+        index.save(path)
+        actual = HashIndex.load(path)
+        # アサーション
+        self.assertEqual(actual.keys, ["a", "b"])
+        self.assertTrue(np.array_equal(actual.hashes, index.hashes))
+        self.assertIn("a", actual)
+
+    def test_query(self):
+        # 初期化
+        index = HashIndex(["a", "b", "c"], np.array(
+            [[0, 0, 0b111], [0, 0, 0b1], [0, 0, 2**64 - 1]], dtype=np.uint64))
+        # テストの実行
+        actual = index.query(0, 3)
+        # アサーション
+        self.assertEqual(actual, [("b", 1), ("a", 3)])
+
+    def test_find_duplicates(self):
+        # 初期化
+        rand = np.random.default_rng(0)
+        base = rand.integers(0, 2**63, 1000, dtype=np.uint64)
+        # 先頭の画像と3bitだけ異なる画像を追加する
+        near = base[0] ^ np.uint64(0b10000000001 << 40 | 1)
+        hashes = np.zeros((1001, 3), dtype=np.uint64)
+        hashes[:, 2] = np.r_[base, near]
+        index = HashIndex([str(i) for i in range(1001)], hashes)
+        # テストの実行
+        actual = index.find_duplicates(3)
+        # アサーション
+        self.assertEqual(actual, [("0", "1000", 3)])
+
+    def test_find_duplicates_many_equal(self):
+        # 初期化
+        rand = np.random.default_rng(1)
+        base = rand.integers(0, 2**63, 200, dtype=np.uint64)
+        # 同一のハッシュが多数ある場合
+        hashes = np.zeros((250, 3), dtype=np.uint64)
+        hashes[:, 2] = np.r_[base, np.repeat(base[:1], 50)]
+        index = HashIndex([str(i) for i in range(250)], hashes)
+        # テストの実行
+        actual = index.find_duplicates(2)
+        # アサーション
+        self.assertEqual(len(actual), 51 * 50 // 2)
+        self.assertEqual({distance for _, _, distance in actual}, {0})
+
+    def test_iter_matches_batches(self):
+        # 初期化
+        values = np.array([1, 2, 1, 1, 2, 3], dtype=np.int64)
+        order = np.argsort(values, kind="stable")
+        counts = np.bincount(values, minlength=4)
+        starts = np.cumsum(counts) - counts
+        # テストの実行
+        # 1度に展開する組が batch_size 程度になるよう小分けにする
+        batches = list(_iter_matches(values, counts, starts, order, 4))
+        # アサーション
+        actual = sorted(zip(np.concatenate([left for left, _ in batches]).tolist(),
+                            np.concatenate([right for _, right in batches]).tolist()))
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(actual, [(0, 2), (0, 3), (1, 4), (2, 3)])
+
+    def test_find_duplicates_max_distance(self):
+        index = HashIndex(["a", "b"], np.zeros((2, 3), dtype=np.uint64))
+        with self.assertRaises(ValueError):
+            index.find_duplicates(MAX_DUPLICATE_DISTANCE + 1)
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.negative_cache import (MEDIA_NOT_FOUND, TWEET_NOT_FOUND,
+                                NegativeCache, build_media_key,
+                                build_tweet_key)
+
+
+def put_entries(path: Path, worker: int, count: int) -> None:
+    cache = NegativeCache(path)
+    for i in range(count):
+        cache.put(build_media_key(f"{worker}_{i}"), MEDIA_NOT_FOUND)
+
+
+class NegativeCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "negative.json"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_memory_only(self):
+        # 初期化
+        cache = NegativeCache()
+        # テストの実行
+        cache.put(build_tweet_key("1"), TWEET_NOT_FOUND)
+        # アサーション
+        self.assertEqual(cache.get(build_tweet_key("1")), TWEET_NOT_FOUND)
+        self.assertIsNone(cache.get(build_media_key("1_0")))
+
+    def test_file_shared(self):
+        # 初期化
+        first = NegativeCache(self.path)
+        second = NegativeCache(self.path)
+        # テストの実行
+        first.put(build_tweet_key("1"), TWEET_NOT_FOUND)
+        second.put(build_media_key("2_0"), MEDIA_NOT_FOUND)
+        # アサーション
+        # 他のインスタンスが書き込んだ記録を消さない
+        actual = NegativeCache(self.path)
+        self.assertEqual(actual.get(build_tweet_key("1")), TWEET_NOT_FOUND)
+        self.assertEqual(actual.get(build_media_key("2_0")), MEDIA_NOT_FOUND)
+
+    def test_expired(self):
+        # 初期化
+        cache = NegativeCache(self.path, ttl=60)
+        with mock.patch("time.time", return_value=1000.0):
+            cache.put(build_tweet_key("1"), TWEET_NOT_FOUND)
+        # テストの実行
+        with mock.patch("time.time", return_value=1059.0):
+            before = cache.get(build_tweet_key("1"))
+        with mock.patch("time.time", return_value=1060.0):
+            after = cache.get(build_tweet_key("1"))
+        # アサーション
+        self.assertEqual(before, TWEET_NOT_FOUND)
+        self.assertIsNone(after)
+
+    def test_reverify(self):
+        # 初期化
+        NegativeCache(self.path).put(build_tweet_key("1"), TWEET_NOT_FOUND)
+        cache = NegativeCache(self.path, reverify=True)
+        # テストの実行
+        actual = cache.get(build_tweet_key("1"))
+        cache.invalidate(build_tweet_key("1"))
+        # アサーション
+        self.assertIsNone(actual)
+        self.assertEqual(len(NegativeCache(self.path)), 0)
+
+    @unittest.skipUnless(os.name == "posix", "posix only")
+    def test_parallel(self):
+        # 初期化
+        workers, count = 4, 50
+        ctx = multiprocessing.get_context("fork")
+        processes = [ctx.Process(target=put_entries, args=(self.path, worker, count))
+                     for worker in range(workers)]
+        # テストの実行
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        # アサーション
+        # 複数プロセスから同時に書き込んでも記録が失われない
+        self.assertEqual(len(NegativeCache(self.path)), workers * count)
+
+    def test_file_without_fcntl(self):
+        # 初期化
+        cache = NegativeCache(self.path)
+        # テストの実行
+        # fcntl のない環境(Windows)ではロックせずに書き込む
+        with mock.patch.object(os, "name", "nt"), \
+                mock.patch.dict(sys.modules, {"fcntl": None}):
+            cache.put(build_tweet_key("1"), TWEET_NOT_FOUND)
+        # アサーション
+        self.assertEqual(NegativeCache(self.path).get(
+            build_tweet_key("1")), TWEET_NOT_FOUND)
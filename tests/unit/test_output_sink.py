@@ -0,0 +1,125 @@
+import datetime
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import boto3
+from freezegun import freeze_time
+from moto import mock_s3
+
+
+class ShardArchiveSinkTest(unittest.TestCase):
+
+    @freeze_time("2022-02-19 00:00:00+00:00")
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            output_dir = Path(tmp_dir)
+            created_at = datetime.datetime(2022, 3, 13, 1)
+            from src.output_sink import ShardArchiveSink, read_archived_img
+            sink = ShardArchiveSink(output_dir)
+            # テストの実行
+            first = sink.write(created_at, "123456789", 0, b"first")
+            second = sink.write(created_at, "123456789", 1, b"second")
+            # アサーション
+            self.assertEqual(first["archive"], "yyyy=2022/mm=03/dd=13.tar")
+            self.assertEqual(first["write_time"], "2022-02-19T09:00:00+09:00")
+            self.assertEqual(second["size"], 6)
+            self.assertEqual(read_archived_img(
+                output_dir, created_at, "123456789", 1), b"second")
+
+
+class S3SinkTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # 安全のためクレデンシャル周りをテスト用に
+        os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+        os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+        os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+        os.environ['AWS_SESSION_TOKEN'] = 'testing'
+        os.environ['AWS_DEFAULT_REGION'] = 'ap-northeast-1'
+
+    def test_build_s3_key(self):
+        # 初期化
+        created_at = datetime.datetime(2022, 3, 13, 1)
+        from src.output_sink import build_s3_key
+        # テストの実行
+        actual = build_s3_key("/liked/", created_at, "123456789", 0)
+        # アサーション
+        self.assertEqual(
+            actual, "liked/yyyy=2022/mm=03/dd=13/123456789_0.png")
+
+    @mock_s3
+    def test_write(self):
+        # 初期化
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="bucket", CreateBucketConfiguration={
+                         "LocationConstraint": "ap-northeast-1"})
+        created_at = datetime.datetime(2022, 3, 13, 1)
+        from src.output_sink import S3Sink
+        sink = S3Sink("bucket", prefix="liked")
+        # テストの実行
+        actual = sink.write(created_at, "123456789", 0, b"image")
+        # アサーション
+        self.assertEqual(
+            actual["s3_key"], "liked/yyyy=2022/mm=03/dd=13/123456789_0.png")
+        obj = s3.get_object(Bucket="bucket", Key=actual["s3_key"])
+        self.assertEqual(obj["Body"].read(), b"image")
+        self.assertEqual(obj["ETag"].strip('"'), actual["etag"])
+
+    @mock_s3
+    def test_write_multipart(self):
+        # 初期化
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="bucket", CreateBucketConfiguration={
+                         "LocationConstraint": "ap-northeast-1"})
+        created_at = datetime.datetime(2022, 3, 13, 1)
+        from src.output_sink import S3Sink
+        sink = S3Sink("bucket", multipart_threshold=5 * 1024 * 1024)
+        data = os.urandom(11 * 1024 * 1024)
+        # テストの実行
+        actual = sink.write(created_at, "123456789", 0, data)
+        # アサーション
+        obj = s3.get_object(Bucket="bucket", Key=actual["s3_key"])
+        self.assertEqual(obj["Body"].read(), data)
+        # マルチパートの ETag は末尾にパート数が付く
+        self.assertTrue(actual["etag"].endswith("-3"))
+
+
+class BuildOutputSinkTest(unittest.TestCase):
+
+    def build_env_param(self, **kwargs):
+        from run import EnvironParamaters
+        return EnvironParamaters(
+            BEARER_TOKEN="BEARER_TOKEN",
+            LIKED_USER_ID="LIKED_USER_ID",
+            PROPERTY_DB_NAME="PROPERTY_DB_NAME",
+            PAGE_TOKE_DB_NAME="PAGE_TOKE_DB_NAME",
+            OUTPUT_DIR="OUTPUT_DIR",
+            PAGETOKE_RESET=False,
+            **kwargs,
+        )
+
+    def test_ok(self):
+        from src.output_sink import (LocalFileSink, S3Sink, ShardArchiveSink,
+                                     build_output_sink)
+        aws_resource = mock.Mock()
+        self.assertIsInstance(build_output_sink(
+            self.build_env_param(), Path.cwd(), aws_resource), LocalFileSink)
+        self.assertIsInstance(build_output_sink(self.build_env_param(
+            OUTPUT_FORMAT="tar"), Path.cwd(), aws_resource), ShardArchiveSink)
+        actual = build_output_sink(self.build_env_param(
+            OUTPUT_FORMAT="s3", S3_BUCKET="bucket", S3_PREFIX="liked"), Path.cwd(), aws_resource)
+        self.assertIsInstance(actual, S3Sink)
+        self.assertEqual(actual.prefix, "liked")
+
+    def test_invalid(self):
+        from src.output_sink import build_output_sink
+        with self.assertRaises(ValueError):
+            build_output_sink(self.build_env_param(
+                OUTPUT_FORMAT="s3"), Path.cwd(), mock.Mock())
+        with self.assertRaises(ValueError):
+            build_output_sink(self.build_env_param(
+                OUTPUT_FORMAT="zip"), Path.cwd(), mock.Mock())
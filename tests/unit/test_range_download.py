@@ -0,0 +1,150 @@
+import io
+import tempfile
+import unittest
+from email.message import Message
+from pathlib import Path
+from unittest import mock
+
+from src.range_download import (IncompleteDownloadError, PartialDownload,
+                                build_validator)
+
+
+def fake_response(status: int, body: bytes, headers: dict) -> io.BytesIO:
+    res = io.BytesIO(body)
+    res.status = status
+    res.headers = Message()
+    for key, value in headers.items():
+        res.headers[key] = value
+    return res
+
+
+class BuildValidatorTest(unittest.TestCase):
+
+    def test_etag(self):
+        actual = build_validator(
+            {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(actual, '"abc"')
+
+    def test_weak_etag(self):
+        # 弱い ETag は If-Range に使えない
+        actual = build_validator(
+            {"ETag": 'W/"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(actual, "Wed, 21 Oct 2015 07:28:00 GMT")
+
+
+class PartialDownloadTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.partial_dir = Path(self.tmp_dir.name) / ".partial"
+        self.url = "https://video.twimg.com/a.mp4"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_receive(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        # テストの実行
+        actual = partial.receive(fake_response(
+            200, b"0123456789", {"Content-Length": "10", "ETag": '"v1"'}), 4)
+        # アサーション
+        self.assertEqual(actual, b"0123456789")
+        # 中断しなければディスクには書き出さず, コピーせずにそのまま返す
+        self.assertFalse(self.partial_dir.exists())
+        self.assertIsInstance(actual, bytearray)
+
+    def test_resume(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        # 10 バイト中 4 バイトで切断された
+        with self.assertRaises(IncompleteDownloadError):
+            partial.receive(fake_response(
+                200, b"0123", {"Content-Length": "10", "ETag": '"v1"'}))
+        # テストの実行
+        headers = partial.build_headers()
+        actual = partial.receive(fake_response(
+            206, b"456789", {"Content-Range": "bytes 4-9/10", "ETag": '"v1"'}))
+        # アサーション
+        self.assertEqual(headers, {"Range": "bytes=4-", "If-Range": '"v1"'})
+        self.assertEqual(actual, b"0123456789")
+        self.assertEqual(list(self.partial_dir.iterdir()), [])
+
+    def test_changed(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        with self.assertRaises(IncompleteDownloadError):
+            partial.receive(fake_response(
+                200, b"0123", {"Content-Length": "10", "ETag": '"v1"'}))
+        # テストの実行
+        # If-Range の検証で変更が検出され, 全体が返ってきた
+        actual = partial.receive(fake_response(
+            200, b"abcdefgh", {"Content-Length": "8", "ETag": '"v2"'}))
+        # アサーション
+        self.assertEqual(actual, b"abcdefgh")
+
+    def test_unexpected_range(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        with self.assertRaises(IncompleteDownloadError):
+            partial.receive(fake_response(
+                200, b"0123", {"Content-Length": "10", "ETag": '"v1"'}))
+        # テストの実行
+        with self.assertRaises(IncompleteDownloadError):
+            partial.receive(fake_response(
+                206, b"23456789", {"Content-Range": "bytes 2-9/10"}))
+        # アサーション
+        # 受信済みの範囲と繋がらないため, 最初から取り直す
+        self.assertEqual(partial.size(), 0)
+        self.assertEqual(partial.build_headers(), {})
+
+    def test_no_validator(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        with self.assertRaises(IncompleteDownloadError):
+            partial.receive(fake_response(
+                200, b"0123", {"Content-Length": "10"}))
+        # テストの実行
+        actual = partial.build_headers()
+        # アサーション
+        # 同一のデータであることを確認できないため, Range は送らない
+        self.assertEqual(actual, {})
+
+    def test_interrupted(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        res = fake_response(
+            200, b"", {"Content-Length": "10", "ETag": '"v1"'})
+        res.read = mock.Mock(side_effect=[b"0123", TimeoutError()])
+        # テストの実行
+        with self.assertRaises(TimeoutError):
+            partial.receive(res)
+        # アサーション
+        # 切断された場合のみ, 受信済みの分を書き出す
+        self.assertEqual(partial.part_path.read_bytes(), b"0123")
+        self.assertEqual(partial.build_headers(), {
+                         "Range": "bytes=4-", "If-Range": '"v1"'})
+
+    def test_stream(self):
+        # 初期化
+        partial = PartialDownload(self.partial_dir, self.url)
+        res = fake_response(
+            200, b"", {"Content-Length": "10", "ETag": '"v1"'})
+        opened = []
+
+        def read(size):
+            # 受信中から partial ファイルに書き込んでいる
+            opened.append(partial.part_path.exists())
+            if len(opened) == 1:
+                return b"0123"
+            raise TimeoutError()
+        res.read = read
+        with self.assertRaises(TimeoutError):
+            partial.receive(res, 4, stream=True)
+        # テストの実行
+        actual = partial.receive(fake_response(
+            206, b"456789", {"Content-Range": "bytes 4-9/10", "ETag": '"v1"'}), 4, stream=True)
+        # アサーション
+        self.assertEqual(opened, [True, True])
+        self.assertEqual(actual, b"0123456789")
+        self.assertEqual(list(self.partial_dir.iterdir()), [])
@@ -0,0 +1,135 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import requests
+
+from src.clock import VirtualClock
+from src.replay import Cassette, Recorder, ReplayServer, build_key
+from src.twitter_api import TwitterApi
+
+
+def build_test_file_path(file_name: str) -> Path:
+    return Path.cwd() / "tests" / "unit" / file_name
+
+
+class BuildKeyTest(unittest.TestCase):
+
+    def test_ok(self):
+        # クエリの順序・scheme に依存しない
+        self.assertEqual(
+            build_key("https://pbs.twimg.com/media/a?name=large&format=png"),
+            build_key("http://pbs.twimg.com/media/a", {"format": "png", "name": "large"}))
+
+
+class CassetteTest(unittest.TestCase):
+
+    def test_save_load(self):
+        # 初期化
+        cassette = Cassette()
+        cassette.add("https://pbs.twimg.com/media/a", None, 200,
+                     [("Content-Type", "image/png"), ("Content-Length", "3")], b"\x89PN", 0.5, 1.0)
+        # テストの実行
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "cassette.json"
+            cassette.save(path)
+            actual = Cassette.load(path)
+        # アサーション
+        # 再生時に付け直すヘッダーは記録しない
+        self.assertEqual(actual.interactions[0]["headers"], [
+                         ["Content-Type", "image/png"]])
+        self.assertIn("body_base64", actual.interactions[0])
+
+
+class ReplayServerTest(unittest.TestCase):
+
+    def test_replay_twitter_api(self):
+        # 初期化
+        clock = VirtualClock()
+        cassette = Cassette.load(
+            build_test_file_path("replay_liked_tweets.json"))
+        # テストの実行
+        with ReplayServer(cassette, clock) as server:
+            api = TwitterApi("sample", base_url=server.url_for(
+                "api.twitter.com"), clock=clock)
+            first = api.get_liked_tweets("100")
+            second = api.get_liked_tweets("100", first["meta"]["next_token"])
+        # アサーション
+        # 2ページ目は 429 の後, 900秒待って再取得する
+        self.assertEqual([data["id"] for data in first["data"] + second["data"]],
+                         ["11", "12", "13"])
+        self.assertEqual(clock.sleeps, [900])
+        self.assertAlmostEqual(clock.now(), 900.52)
+        self.assertEqual(server.unmatched, [])
+        self.assertEqual(server.remaining(), 0)
+
+    def test_rewrite_and_binary(self):
+        # 初期化
+        cassette = Cassette()
+        cassette.add("https://api.twitter.com/1.1/statuses/show.json", {"id": "1"}, 200,
+                     [("Content-Type", "application/json")],
+                     b'{"media_url_https": "https:\\/\\/pbs.twimg.com\\/media\\/a.jpg"}')
+        cassette.add("https://pbs.twimg.com/media/a?format=png&name=large", None, 200,
+                     [("Content-Type", "image/png")], b"\x89PNG\xff")
+        # テストの実行
+        with ReplayServer(cassette) as server:
+            tweet = requests.get(
+                f"{server.url_for('api.twitter.com')}/1.1/statuses/show.json", params={"id": "1"}).json()
+            with urlopen(f"{tweet['media_url_https'][:-4]}?format=png&name=large") as res:
+                body = res.read()
+            # 記録にないリクエスト
+            with self.assertRaises(HTTPError):
+                urlopen(tweet["media_url_https"])
+        # アサーション
+        self.assertEqual(tweet["media_url_https"],
+                         f"{server.url_for('pbs.twimg.com')}/media/a.jpg")
+        self.assertEqual(body, b"\x89PNG\xff")
+        self.assertEqual(server.unmatched, ["pbs.twimg.com/media/a.jpg?"])
+
+
+class RecorderTest(unittest.TestCase):
+
+    def test_session(self):
+        # 初期化
+        recorder = Recorder()
+        res = requests.Response()
+        res.status_code = 200
+        res.headers["x-rate-limit-remaining"] = "74"
+        res._content = b'{"data": []}'
+        res.elapsed = mock.Mock(total_seconds=mock.Mock(return_value=0.25))
+        inner = mock.Mock()
+        inner.get.return_value = res
+        api = TwitterApi("sample", session=recorder.session(inner))
+        # テストの実行
+        api.get_liked_tweets("100", "p2")
+        # アサーション
+        # 認証情報(リクエストヘッダー)は記録しない
+        actual = recorder.cassette.interactions[0]
+        self.assertEqual(
+            actual["key"], "api.twitter.com/2/users/100/liked_tweets?pagination_token=p2&tweet.fields=id")
+        self.assertEqual(actual["headers"], [["x-rate-limit-remaining", "74"]])
+        self.assertEqual(actual["elapsed"], 0.25)
+        self.assertNotIn("sample", str(actual))
+
+    def test_urlopen(self):
+        # 初期化
+        cassette = Cassette()
+        cassette.add("https://pbs.twimg.com/media/a?format=png&name=large", None, 200,
+                     [("Content-Type", "image/png")], b"\x89PNG\xff")
+        recorder = Recorder()
+        # テストの実行
+        started_at = time.monotonic()
+        with ReplayServer(cassette) as server, recorder.patch_urlopen():
+            import urllib.request
+            with urllib.request.urlopen(f"{server.url_for('pbs.twimg.com')}/media/a?format=png&name=large") as res:
+                body = res.read()
+        # アサーション
+        self.assertEqual(body, b"\x89PNG\xff")
+        self.assertEqual(recorder.cassette.interactions[0]["key"].split("/", 1)[1],
+                         "pbs.twimg.com/media/a?format=png&name=large")
+        self.assertLess(recorder.cassette.interactions[0]["offset"],
+                        time.monotonic() - started_at + 0.001)
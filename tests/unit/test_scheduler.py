@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from src.scheduler import AdaptiveInterval
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+
+    def test_backoff(self):
+        # 初期化
+        interval = AdaptiveInterval(60, 300, backoff=2.0, jitter=0.0)
+        # テストの実行
+        actual = [interval.next(False) for _ in range(4)]
+        # アサーション
+        self.assertEqual(actual, [120, 240, 300, 300])
+
+    def test_reset(self):
+        # 初期化
+        interval = AdaptiveInterval(60, 300, backoff=2.0, jitter=0.0)
+        interval.next(False)
+        interval.next(False)
+        # テストの実行
+        actual = interval.next(True)
+        # アサーション
+        self.assertEqual(actual, 60)
+
+    def test_jitter(self):
+        # 初期化
+        interval = AdaptiveInterval(
+            100, 100, jitter=0.1, rand=random.Random(0))
+        # テストの実行
+        actual = [interval.next(True) for _ in range(100)]
+        # アサーション
+        self.assertTrue(all(90 <= value <= 110 for value in actual))
+        self.assertGreater(len(set(actual)), 1)
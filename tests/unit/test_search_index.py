@@ -0,0 +1,144 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.search_index import (SearchIndex, build_location, build_match,
+                              document_tokens, load_table_export)
+
+
+def sample_property(partition_key: str, text: str, hashtag: str = "", created_at: str = "2020-08-12T22:11:22+09:00") -> dict:
+    return {
+        "partition_key": partition_key,
+        "created_at": created_at,
+        "text": text,
+        "user_name": "ノエル",
+        "user_screen_name": "noel_sample",
+        "hashtag": hashtag,
+        "write_time": "2022-03-17T13:46:01.965558+09:00",
+    }
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_document_tokens(self):
+        # テストの実行
+        actual = document_tokens("夏祭り🎆 Genshin、原神")
+        # アサーション
+        self.assertEqual(actual, "夏祭 祭り り genshin 原神 神")
+
+    def test_build_match(self):
+        # テストの実行
+        actual = build_match("#原神 夏 @noel")
+        # アサーション
+        self.assertEqual(
+            actual, 'hashtag : "原神" AND "夏"* AND user : "noel"*')
+
+
+class BuildLocationTest(unittest.TestCase):
+
+    def test_file(self):
+        # テストの実行
+        actual = build_location(sample_property("1_0", "夏"))
+        # アサーション
+        self.assertEqual(actual, "yyyy=2020/mm=08/dd=12/1_0.png")
+
+    def test_archive(self):
+        # 初期化
+        item = sample_property("1_0", "夏")
+        item["archive"] = "yyyy=2020/mm=08/dd=12.tar"
+        # テストの実行
+        actual = build_location(item)
+        # アサーション
+        self.assertEqual(actual, "yyyy=2020/mm=08/dd=12.tar#1_0.png")
+
+    def test_s3(self):
+        # 初期化
+        item = sample_property("1_0", "夏")
+        item["s3_key"] = "liked/yyyy=2020/mm=08/dd=12/1_0.png"
+        # テストの実行
+        actual = build_location(item)
+        # アサーション
+        self.assertEqual(actual, "s3:liked/yyyy=2020/mm=08/dd=12/1_0.png")
+
+    def test_video(self):
+        # 初期化
+        item = sample_property("1_0", "夏")
+        item["media_type"] = "animated_gif"
+        # テストの実行
+        actual = build_location(item)
+        # アサーション
+        self.assertEqual(actual, "yyyy=2020/mm=08/dd=12/1_0.mp4")
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = SearchIndex(Path(self.tmp_dir.name) / "search.sqlite3")
+        self.index.add(sample_property("1_0", "夏祭りの浴衣", "原神,GenshinImpact",
+                                       "2020-08-12T22:11:22+09:00"))
+        self.index.add(sample_property("2_0", "初夏の海", "",
+                                       "2021-06-01T10:00:00+09:00"))
+
+    def tearDown(self) -> None:
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def search_keys(self, query: str) -> list:
+        return [result["partition_key"] for result in self.index.search(query)]
+
+    def test_search_japanese(self):
+        self.assertEqual(self.search_keys("祭り"), ["1_0"])
+        self.assertEqual(self.search_keys("浴衣"), ["1_0"])
+        # 1文字での検索は新しい順
+        self.assertEqual(self.search_keys("夏"), ["2_0", "1_0"])
+        self.assertEqual(self.search_keys("夏の"), ["2_0"])
+        self.assertEqual(self.search_keys("冬"), [])
+
+    def test_search_hashtag(self):
+        self.assertEqual(self.search_keys("#genshin"), ["1_0"])
+        self.assertEqual(self.search_keys("#原神"), ["1_0"])
+        self.assertEqual(self.search_keys("#浴衣"), [])
+
+    def test_search_user(self):
+        self.assertEqual(self.search_keys("@noel_sample 海"), ["2_0"])
+        self.assertEqual(self.search_keys("@ノエル"), ["2_0", "1_0"])
+
+    def test_upsert(self):
+        # テストの実行
+        self.index.add(sample_property("1_0", "冬の海"))
+        # アサーション
+        self.assertEqual(self.search_keys("祭り"), [])
+        self.assertEqual(self.search_keys("冬"), ["1_0"])
+
+    def test_rebuild(self):
+        # 初期化
+        items = [
+            sample_property("3_0", "紅葉"),
+            # 画像のプロパティ以外は対象外
+            {"partition_key": "lease#shard-00000", "owner": "owner"},
+        ]
+        # テストの実行
+        actual = self.index.rebuild(items)
+        # アサーション
+        self.assertEqual(actual, 1)
+        self.assertEqual(self.search_keys("夏"), [])
+        self.assertEqual(self.search_keys("紅葉"), ["3_0"])
+
+
+class LoadTableExportTest(unittest.TestCase):
+
+    def test_ok(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            path = Path(tmp_dir) / "export.json"
+            path.write_text(json.dumps({"Item": {
+                "partition_key": {"S": "1_0"},
+                "offset": {"N": "512"},
+            }}) + "\n")
+            # テストの実行
+            actual = list(load_table_export(path))
+            # アサーション
+            self.assertEqual(
+                actual, [{"partition_key": "1_0", "offset": "512"}])
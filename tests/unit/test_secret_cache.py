@@ -0,0 +1,69 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.secret_cache import SecretCache
+
+
+class SecretCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "secret.json"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_memory_only(self):
+        # 初期化
+        cache = SecretCache()
+        # テストの実行
+        cache.put("key", "value")
+        # アサーション
+        self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(cache.get("other"))
+
+    def test_file_shared(self):
+        # 初期化
+        SecretCache(self.path).put("key", "value")
+        # テストの実行
+        actual = SecretCache(self.path).get("key")
+        # アサーション
+        self.assertEqual(actual, "value")
+        if os.name == "posix":
+            self.assertEqual(stat.S_IMODE(self.path.stat().st_mode), 0o600)
+
+    @mock.patch("time.time")
+    def test_expired(self, time_mock: mock.Mock):
+        # 初期化
+        time_mock.return_value = 1000
+        cache = SecretCache(self.path, ttl=60)
+        cache.put("key", "value")
+        # テストの実行
+        time_mock.return_value = 1060
+        actual = cache.get("key")
+        # アサーション
+        self.assertIsNone(actual)
+
+    def test_invalidate(self):
+        # 初期化
+        cache = SecretCache(self.path)
+        cache.put("key", "value")
+        # テストの実行
+        cache.invalidate("key")
+        # アサーション
+        self.assertIsNone(cache.get("key"))
+        self.assertIsNone(SecretCache(self.path).get("key"))
+
+    @unittest.skipUnless(os.name == "posix", "posix only")
+    def test_loose_permissions(self):
+        # 初期化
+        SecretCache(self.path).put("key", "value")
+        os.chmod(self.path, 0o644)
+        # テストの実行
+        actual = SecretCache(self.path).get("key")
+        # アサーション
+        self.assertIsNone(actual)
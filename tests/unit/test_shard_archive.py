@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.shard_archive import (ShardArchive, ShardArchiveReader,
+                               build_index_path, load_index)
+
+
+def append_members(tar_path: Path, worker: int, count: int) -> None:
+    archive = ShardArchive(tar_path)
+    for i in range(count):
+        archive.append(f"{worker}_{i}.png", bytes([worker]) * (100 + i * 37))
+
+
+class ShardArchiveTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tar_path = Path(self.tmp_dir.name) / "mm=03" / "dd=13.tar"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_append(self):
+        # 初期化
+        archive = ShardArchive(self.tar_path)
+        # テストの実行
+        archive.append("1_0.png", b"a" * 10)
+        archive.append("1_1.png", b"b" * 1000)
+        # アサーション
+        # 通常の tar として読み出せる
+        with tarfile.open(self.tar_path, "r") as tar:
+            self.assertEqual(tar.getnames(), ["1_0.png", "1_1.png"])
+            self.assertEqual(tar.extractfile("1_1.png").read(), b"b" * 1000)
+
+    def test_reader(self):
+        # 初期化
+        archive = ShardArchive(self.tar_path)
+        archive.append("1_0.png", b"a" * 10)
+        archive.append("1_1.png", b"b" * 1000)
+        # テストの実行
+        with ShardArchiveReader(self.tar_path) as reader:
+            # アサーション
+            self.assertEqual(reader.names(), ["1_0.png", "1_1.png"])
+            self.assertIn("1_0.png", reader)
+            self.assertEqual(reader.read("1_0.png"), b"a" * 10)
+            self.assertEqual(reader.read("1_1.png"), b"b" * 1000)
+
+    def test_rebuild_index(self):
+        # 初期化
+        archive = ShardArchive(self.tar_path)
+        archive.append("1_0.png", b"a" * 10)
+        archive.append("1_1.png", b"b" * 1000)
+        expect = load_index(self.tar_path)
+        build_index_path(self.tar_path).unlink()
+        # テストの実行
+        actual = archive.rebuild_index()
+        # アサーション
+        self.assertEqual(actual, 2)
+        self.assertEqual(load_index(self.tar_path), expect)
+
+    @unittest.skipUnless(os.name == "posix", "posix only")
+    def test_append_parallel(self):
+        # 初期化
+        workers, count = 4, 50
+        ctx = multiprocessing.get_context("fork")
+        processes = [ctx.Process(target=append_members, args=(self.tar_path, worker, count))
+                     for worker in range(workers)]
+        # テストの実行
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        # アサーション
+        # 複数プロセスから同じシャードに追記しても, 全メンバーを tar とインデックスの両方から読み出せる
+        with tarfile.open(self.tar_path, "r") as tar:
+            self.assertEqual(len(tar.getnames()), workers * count)
+        with ShardArchiveReader(self.tar_path) as reader:
+            self.assertEqual(len(reader.names()), workers * count)
+            for worker in range(workers):
+                for i in range(count):
+                    self.assertEqual(reader.read(f"{worker}_{i}.png"),
+                                     bytes([worker]) * (100 + i * 37))
+
+    def test_append_without_fcntl(self):
+        # 初期化
+        archive = ShardArchive(self.tar_path)
+        # テストの実行
+        # fcntl のない環境(Windows)ではロックせずに追記する
+        with mock.patch.object(os, "name", "nt"), \
+                mock.patch.dict(sys.modules, {"fcntl": None}):
+            archive.append("1_0.png", b"a" * 10)
+        # アサーション
+        with tarfile.open(self.tar_path) as tar:
+            self.assertEqual(tar.getnames(), ["1_0.png"])
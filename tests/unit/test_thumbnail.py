@@ -0,0 +1,100 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    # requirements_image.txt をインストールしていない場合
+    raise unittest.SkipTest("Pillow is not installed")
+
+from src.thumbnail import ThumbnailStage, build_thumbnail_path, make_thumbnail
+
+
+def png_bytes(size: tuple) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (255, 0, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class BuildThumbnailPathTest(unittest.TestCase):
+
+    def test_ok(self):
+        # 初期化
+        output_dir = Path("output")
+        image_path = output_dir / "yyyy=2022" / "mm=03" / "dd=13" / "1_0.png"
+        # テストの実行
+        actual = build_thumbnail_path(
+            output_dir, Path("thumb"), image_path, "jpeg")
+        # アサーション
+        self.assertEqual(actual, Path("thumb") / "yyyy=2022" /
+                         "mm=03" / "dd=13" / "1_0.jpg")
+
+
+class MakeThumbnailTest(unittest.TestCase):
+
+    def test_ok(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 初期化
+            dest = Path(tmp_dir) / "sub" / "1_0.webp"
+            # テストの実行
+            make_thumbnail(png_bytes((1200, 600)), dest, 256, "webp")
+            # アサーション
+            with Image.open(dest) as img:
+                self.assertEqual(img.format, "WEBP")
+                self.assertEqual(img.size, (256, 128))
+
+
+class ThumbnailStageTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name) / "output"
+        self.thumb_dir = Path(self.tmp_dir.name) / "thumb"
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_submit(self):
+        # 初期化
+        stage = ThumbnailStage(self.output_dir, self.thumb_dir, workers=1)
+        image_path = self.output_dir / "yyyy=2022" / "mm=03" / "dd=13" / "1_0.png"
+        # テストの実行
+        actual = stage.submit(image_path, png_bytes((64, 64)))
+        stage.close()
+        # アサーション
+        self.assertTrue(actual)
+        self.assertTrue(stage.thumbnail_path(image_path).exists())
+
+    def test_submit_busy(self):
+        # 初期化
+        stage = ThumbnailStage(self.output_dir, self.thumb_dir,
+                               workers=1, max_pending=0)
+        image_path = self.output_dir / "yyyy=2022" / "mm=03" / "dd=13" / "1_0.png"
+        # テストの実行
+        actual = stage.submit(image_path, png_bytes((64, 64)))
+        stage.close()
+        # アサーション
+        self.assertFalse(actual)
+        self.assertFalse(stage.thumbnail_path(image_path).exists())
+
+    def test_catch_up(self):
+        # 初期化
+        day_dir = self.output_dir / "yyyy=2022" / "mm=03" / "dd=13"
+        day_dir.mkdir(parents=True)
+        for id in range(3):
+            (day_dir / f"{id}_0.png").write_bytes(png_bytes((64, 64)))
+        stage = ThumbnailStage(self.output_dir, self.thumb_dir,
+                               workers=1, max_pending=1)
+        stage.submit(day_dir / "0_0.png", day_dir / "0_0.png", block=True)
+        stage.close()
+        # テストの実行
+        actual = stage.catch_up()
+        stage.close()
+        # アサーション
+        # 生成済みのサムネイルは対象外
+        self.assertEqual(actual, 2)
+        for id in range(3):
+            self.assertTrue(stage.thumbnail_path(
+                day_dir / f"{id}_0.png").exists())
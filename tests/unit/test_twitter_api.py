@@ -1,4 +1,5 @@
 import json
+import threading
 import unittest
 from pathlib import Path
 from unittest import mock
@@ -6,6 +7,7 @@ from unittest import mock
 import requests
 from requests.exceptions import Timeout
 
+from src.clock import VirtualClock, WaitInterrupted
 from src.twitter_api import (ClientErrorException, DoseNotExistException,
                              LateLimitException, RetryOverException,
                              ServerErrorException, TwitterApi)
@@ -160,6 +162,76 @@ class TwitterApiGetLikedTweetsTest(unittest.TestCase):
         for args in time_sleep_mock.call_args_list:
             self.assertEqual(args[0][0], 15)
 
+    @mock.patch("requests.get")
+    def test_get_liked_tweets_retry_stopped(self, request_get_mock: mock.Mock):
+        # 初期化
+        stop_event = threading.Event()
+        api = TwitterApi("sample", stop_event=stop_event)
+
+        def get(*args, **kwargs):
+            stop_event.set()
+            return responce(429, build_test_file_path("get_liked_tweets_error.json"))
+        request_get_mock.side_effect = get
+        # テストの実行
+        # 停止要求があれば 900 秒待たずに打ち切る
+        with self.assertRaises(WaitInterrupted):
+            api.get_liked_tweets("sample")
+        # アサーション
+        self.assertEqual(request_get_mock.call_count, 1)
+
+
+class TwitterApiClockTest(unittest.TestCase):
+
+    def test_retry_wait(self):
+        # 初期化
+        clock = VirtualClock()
+        api = TwitterApi("sample", clock=clock)
+        api.rate_limit_wait = 60
+        # テストの実行
+        with mock.patch.object(TwitterApi, "_requests_get", side_effect=[
+                LateLimitException(429, {}), {"data": []}]):
+            actual = api.get_liked_tweets("100")
+        # アサーション
+        # 待ち時間は調整でき, 実際には待たない
+        self.assertEqual(actual, {"data": []})
+        self.assertEqual(clock.sleeps, [60])
+
+
+class TwitterApiUnauthorizedTest(unittest.TestCase):
+
+    @mock.patch("requests.get")
+    def test_refresh_token(self, request_get_mock: mock.Mock):
+        # 初期化
+        on_unauthorized = mock.Mock(return_value="refreshed")
+        api = TwitterApi("expired", on_unauthorized)
+        request_get_mock.side_effect = [
+            responce(401, build_test_file_path("statuses_show_error.json")),
+            responce(200, build_test_file_path("statuses_show_ok.json")),
+        ]
+        # テストの実行
+        res = api.get_statuses_show("sample")
+        # アサーション
+        self.assertEqual(res["id_str"], "1499999999999999999")
+        self.assertEqual(on_unauthorized.call_count, 1)
+        self.assertEqual(
+            request_get_mock.call_args[1]["headers"]["Authorization"], "Bearer refreshed")
+
+    @mock.patch("requests.get")
+    def test_refresh_token_still_unauthorized(self, request_get_mock: mock.Mock):
+        # 初期化
+        on_unauthorized = mock.Mock(return_value="refreshed")
+        api = TwitterApi("expired", on_unauthorized)
+        request_get_mock.side_effect = [
+            responce(401, build_test_file_path("statuses_show_error.json")),
+            responce(401, build_test_file_path("statuses_show_error.json")),
+        ]
+        # テストの実行
+        with self.assertRaises(ClientErrorException) as e:
+            api.get_statuses_show("sample")
+        # アサーション
+        self.assertEqual(e.exception.status_code, 401)
+        self.assertEqual(request_get_mock.call_count, 2)
+
 
 class TwitterApiGetStatusesShow(unittest.TestCase):
 